@@ -0,0 +1,59 @@
+import io
+import os
+import tempfile
+
+# Rows converted per pass; keeps memory flat no matter how large the file is
+CHUNK_ROWS = 250_000
+PREVIEW_ROWS = 20
+
+
+def pasted_column_to_csv(text, column="value"):
+    """Turn a pasted column of numbers (one per line) into a CSV file object"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return io.StringIO(column + "\n" + "\n".join(lines))
+
+
+def read_columns(source):
+    """Return the column names of a CSV file object without reading its rows"""
+    # pandas is imported on first use so the converter page loads without it
+    import pandas as pd
+    columns = list(pd.read_csv(source, nrows=0).columns)
+    source.seek(0)
+    return columns
+
+
+def convert_csv(source, column, convert, result_column, chunk_rows=CHUNK_ROWS):
+    """Convert one column of a CSV chunk by chunk into a temporary CSV file
+
+    convert receives a NumPy array of the column and returns the converted array.
+    Returns (output path, rows converted, preview DataFrame of the first rows);
+    the caller deletes the file, e.g. with read_and_remove.
+    """
+    import pandas as pd
+    output = tempfile.NamedTemporaryFile(
+        mode="w", suffix=".csv", prefix="unitxchange_batch_", delete=False, newline=""
+    )
+    rows = 0
+    preview = None
+    try:
+        with output:
+            for chunk in pd.read_csv(source, chunksize=chunk_rows):
+                values = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype="float64")
+                chunk[result_column] = convert(values)
+                chunk.to_csv(output, header=rows == 0, index=False)
+                if preview is None:
+                    preview = chunk.head(PREVIEW_ROWS)
+                rows += len(chunk)
+    except BaseException:
+        os.remove(output.name)
+        raise
+    return output.name, rows, preview
+
+
+def read_and_remove(path):
+    """Return the bytes of a converted file and delete it from disk"""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
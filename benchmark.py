@@ -0,0 +1,393 @@
+"""Benchmarks for the parser, converters, chat storage, full bot turns and startup
+
+Run `python benchmark.py --output results.json` and compare the JSON files of
+two commits to spot regressions. Gemini is replaced by a local fake, so no
+API key or network is needed.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+from chat_index import search_expression
+from chat_store import ChatStore
+from conversion_engine import answer_query, parse_conversion, split_queries
+from currency_rates import RateTable
+from dimensions import apply_plan, compile_plan, parse_unit
+from fuzzy_units import correct_unit, get_unit_tree
+from unit_registry import UNITS, convert
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Unit expression pairs for the compound conversion benchmarks
+COMPOUND_PAIRS = [("kg/m³", "lb/ft³"), ("kWh", "MJ"), ("L/100km", "mpg"), ("J/(kg·K)", "cal/(g·°C)")]
+# Misspelled unit names for the fuzzy lookup benchmark, plus one that matches nothing
+TYPOS = ["kilometrs", "farenheit", "ounzes", "milimeters", "celcius", "galons", "minuts", "xxxxxxxxx"]
+SEED = 1234
+CORPUS_SIZE = 5000
+STORE_SIZES = [10, 1_000, 100_000]
+ARRAY_SIZE = 100_000
+# Our modules, timed with python -X importtime in a fresh interpreter each run
+STARTUP_MODULES = [
+    "unit_registry", "conversion_engine", "response_cache", "chat_store", "context_window",
+    "fan_out", "metrics", "currency_rates", "batch_convert",
+]
+# Slow imports that should only load when a feature first needs them
+DEFERRED_MODULES = ["google.generativeai", "requests", "pandas"]
+STARTUP_RUNS = 5
+# First run of an app script in a fresh interpreter; prints seconds and which deferred modules loaded
+FIRST_RUN_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+start = time.perf_counter()
+app.run()
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in sys.argv[2:] if m in sys.modules]]))
+"""
+
+
+def measure(name, func, runs, warmup=3, **info):
+    """Time func over several runs and report latency percentiles in microseconds"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    return summarize(name, np.array(timings) / 1000, **info)
+
+
+def summarize(name, timings, **info):
+    """Report throughput and latency percentiles for timings in microseconds"""
+    timings = np.asarray(timings, dtype="float64")
+    runs = len(timings)
+    p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+    result = {
+        "name": name,
+        "runs": runs,
+        "ops_per_sec": round(runs / (timings.sum() / 1e6), 2),
+        "mean_us": round(float(timings.mean()), 3),
+        "p50_us": round(float(p50), 3),
+        "p90_us": round(float(p90), 3),
+        "p99_us": round(float(p99), 3),
+        "max_us": round(float(timings.max()), 3),
+        **info,
+    }
+    print(f"{name:<45} p50 {result['p50_us']:>12.1f} us   p99 {result['p99_us']:>12.1f} us", file=sys.stderr)
+    return result
+
+
+def build_corpus(size=CORPUS_SIZE, seed=SEED):
+    """Mix realistic conversion questions with chat and adversarial inputs"""
+    rng = random.Random(seed)
+    spellings = [
+        (category, [unit, label.lower(), *aliases])
+        for category, entries in UNITS.items()
+        for unit, label, _, aliases in entries
+    ]
+    templates = [
+        "convert {v} {a} to {b}",
+        "Convert {v} {a} into {b} please",
+        "how many {b} in {v} {a}?",
+        "what is {v} {a} in {b}",
+        "{v}{a} to {b}",
+        "convert {v} {a} to {b} and {v2} {c} to {d}",
+    ]
+    adversarial = [
+        "hello there, how are you?",
+        "convert the file to pdf",
+        "convert " + "9" * 400 + " km to miles",
+        "to " * 200,
+        "convert 5 km to kg",
+        "convert -40 °c to °f",
+        "what is the meaning of life in numbers",
+        "convert 1e309 meters to feet",
+        "how many how many how many in in in",
+        "convert 5 kilometres to 🚀",
+        "x" * 2000,
+    ]
+    corpus = []
+    for _ in range(size):
+        if rng.random() < 0.2:
+            corpus.append(rng.choice(adversarial))
+            continue
+        category, first = rng.choice(spellings)
+        same_category = [names for c, names in spellings if c == category]
+        corpus.append(rng.choice(templates).format(
+            v=round(rng.uniform(-1000, 1000), rng.randint(0, 3)),
+            a=rng.choice(first),
+            b=rng.choice(rng.choice(same_category)),
+            v2=rng.randint(1, 500),
+            c=rng.choice(first),
+            d=rng.choice(rng.choice(same_category)),
+        ))
+    return corpus
+
+
+def bench_parser(runs):
+    """Parse, split and locally answer a whole corpus per run"""
+    corpus = build_corpus()
+    info = {"prompts": len(corpus)}
+
+    def answer_all():
+        for prompt in corpus:
+            query = parse_conversion(prompt)
+            if query:
+                answer_query(query)
+
+    def correct_typos():
+        correct_unit.cache_clear()
+        for word in TYPOS:
+            correct_unit(word)
+
+    get_unit_tree()
+
+    return [
+        measure("parser/parse_conversion_corpus", lambda: [parse_conversion(p) for p in corpus], runs, **info),
+        measure("parser/split_queries_corpus", lambda: [split_queries(p) for p in corpus], runs, **info),
+        measure("parser/answer_corpus", answer_all, runs, **info),
+        measure("parser/correct_unit_uncached", correct_typos, runs * 10, words=len(TYPOS)),
+    ]
+
+
+def bench_converters(runs):
+    """Convert a single value and a large array in every category and a few unit expressions"""
+    results = []
+    values = np.random.default_rng(SEED).uniform(-1000, 1000, ARRAY_SIZE)
+    for category, entries in UNITS.items():
+        from_unit, to_unit = entries[0][0], entries[-1][0]
+        results.append(measure(f"convert/{category.lower()}_scalar", lambda: convert(12.5, from_unit, to_unit), runs * 100))
+        results.append(measure(
+            f"convert/{category.lower()}_array", lambda: convert(values, from_unit, to_unit), runs, values=ARRAY_SIZE
+        ))
+    for from_text, to_text in COMPOUND_PAIRS:
+        name = f"convert/compound_{from_text}_{to_text}"
+        # Cold: parse both expressions and check dimensions; warm: the cached plan
+        results.append(measure(
+            f"{name}_compile",
+            lambda: (parse_unit.cache_clear(), compile_plan.cache_clear(), compile_plan(from_text, to_text)),
+            runs * 10,
+        ))
+        results.append(measure(
+            f"{name}_scalar", lambda: apply_plan(compile_plan(from_text, to_text), 12.5), runs * 100
+        ))
+        results.append(measure(
+            f"{name}_array", lambda: apply_plan(compile_plan(from_text, to_text), values), runs, values=ARRAY_SIZE
+        ))
+    rng = random.Random(SEED)
+    table = RateTable({f"C{i:02d}": rng.uniform(0.1, 200) for i in range(160)})
+    results.append(measure("convert/currency_scalar", lambda: table.rate("C01", "C02") * 12.5, runs * 100))
+    results.append(measure("convert/currency_to_all", lambda: table.convert_to_all(12.5, "C01"), runs * 10))
+    results.append(measure(
+        "convert/currency_table", lambda: table.convert_table(values[:1000], "C01"), runs, values=1000 * len(table.codes)
+    ))
+    return results
+
+
+def bench_store(runs, workdir):
+    """Append a turn to, load and search chats holding 10, 1k and 100k messages"""
+    results = []
+    for size in STORE_SIZES:
+        store = ChatStore(os.path.join(workdir, f"bench_{size}.db"))
+        store.create_chat("bench")
+        store.append_messages("bench", [
+            {"role": "user" if i % 2 == 0 else "model", "text": f"convert {i} km to miles"} for i in range(size)
+        ])
+        turn = [{"role": "user", "text": "convert 5 km to miles"}, {"role": "model", "text": "3.106856 miles"}]
+        load_runs = max(3, runs // max(1, size // 1000))
+        results.append(measure(f"store/append_turn_{size}", lambda: store.append_messages("bench", turn), runs, messages=size))
+        results.append(measure(f"store/load_messages_{size}", lambda: store.load_messages("bench"), load_runs, messages=size))
+        results.append(measure(f"store/list_chats_{size}", store.list_chats, runs, messages=size))
+        match = search_expression("5 km to miles")
+        results.append(measure(f"store/search_{size}", lambda: store.search_messages(match), runs, messages=size))
+    return results
+
+
+def install_fake_genai(latency):
+    """Replace google.generativeai with a local fake that answers after a fixed delay"""
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+            self.parts = [text]
+
+        def __iter__(self):
+            for word in self.text.split(" "):
+                yield types.SimpleNamespace(text=word + " ", parts=[word])
+
+    class Chat:
+        def __init__(self):
+            self.history = []
+
+        def send_message(self, message, stream=False, **kwargs):
+            time.sleep(latency)
+            return Response("The answer is 42 units")
+
+    class Model:
+        def __init__(self, model_name, generation_config=None, **kwargs):
+            self.model_name = model_name
+
+        def start_chat(self, history=None):
+            return Chat()
+
+        def generate_content(self, contents, **kwargs):
+            time.sleep(latency)
+            return Response("42 units")
+
+        async def generate_content_async(self, contents, **kwargs):
+            await asyncio.sleep(latency)
+            return Response("42 units")
+
+    fake = types.ModuleType("google.generativeai")
+    fake.configure = lambda **kwargs: None
+    fake.GenerativeModel = Model
+    import google
+    google.generativeai = fake
+    sys.modules["google.generativeai"] = fake
+
+
+def bench_bot(runs, workdir, latency):
+    """Run full Streamlit turns of the bot, from chat input to saved messages"""
+    from streamlit.testing.v1 import AppTest
+
+    install_fake_genai(latency)
+    script = glob.glob(os.path.join(ROOT, "*-unitXchange-bot.py"))[0]
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        app = AppTest.from_file(script, default_timeout=60)
+        app.run()
+        counter = iter(range(10**9))
+
+        def turn(prompt_format, temperature):
+            def run():
+                if app.sidebar.slider[0].value != temperature:
+                    app.sidebar.slider[0].set_value(temperature)
+                app.chat_input[0].set_value(prompt_format.format(next(counter))).run()
+                if app.exception:
+                    raise RuntimeError(app.exception)
+            return run
+
+        info = {"model_latency_s": latency}
+        return [
+            measure("bot/turn_strict_local", turn("convert {} km to miles", 0.0), runs, **info),
+            measure("bot/turn_strict_model", turn("convert {} km to kg", 0.0), runs, **info),
+            measure("bot/turn_creative_stream", turn("convert {} km to kg", 0.7), runs, **info),
+            measure("bot/turn_multi_question", turn("convert {} km to kg and 5 lb to kg", 0.0), runs, **info),
+            measure("bot/rerun_idle", app.run, runs, **info),
+        ]
+    finally:
+        os.chdir(previous_dir)
+
+
+def import_times(module=None):
+    """Return {module: cumulative import microseconds} for importing module in a fresh interpreter"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}" if module else "pass"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def bench_startup(workdir):
+    """Profile import time of our modules and the first run of each app"""
+    results = []
+    # Imports the interpreter does before running anything (site, .pth hooks)
+    interpreter_imports = set(import_times())
+    for module in STARTUP_MODULES:
+        runs = [import_times(module) for _ in range(STARTUP_RUNS)]
+        slowest = sorted(
+            (item for item in runs[-1].items() if item[0] not in interpreter_imports and item[0] != module),
+            key=lambda item: item[1], reverse=True,
+        )[:5]
+        results.append(summarize(
+            f"startup/import_{module}", [times[module] for times in runs],
+            deferred_loaded=[m for m in DEFERRED_MODULES if m in runs[-1]],
+            slowest_imports=dict(slowest),
+        ))
+    apps = {
+        "bot": glob.glob(os.path.join(ROOT, "*-unitXchange-bot.py"))[0],
+        "converter": os.path.join(ROOT, "pages", "unitXchange.py"),
+    }
+    # Keep the converter page's background rate refresh off the network
+    env = {**os.environ, "CURRENCY_RATES_URL": "http://127.0.0.1:9/latest"}
+    for app, script in apps.items():
+        timings, loaded = [], []
+        for _ in range(STARTUP_RUNS):
+            process = subprocess.run(
+                [sys.executable, "-c", FIRST_RUN_SCRIPT, script, *DEFERRED_MODULES],
+                cwd=workdir, env=env, capture_output=True, text=True, check=True,
+            )
+            elapsed, loaded = json.loads(process.stdout.strip().splitlines()[-1])
+            timings.append(elapsed * 1e6)
+        results.append(summarize(f"startup/first_run_{app}", timings, deferred_loaded=loaded))
+    return results
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+GROUPS = ["parser", "converters", "store", "bot", "startup"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark unitXchange")
+    parser.add_argument("--only", choices=GROUPS, action="append", help="run just these groups")
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="seconds the fake Gemini waits per call")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="unitxchange_bench_") as workdir:
+        for group in args.only or GROUPS:
+            if group == "parser":
+                results += bench_parser(args.runs)
+            elif group == "converters":
+                results += bench_converters(args.runs)
+            elif group == "store":
+                results += bench_store(args.runs, workdir)
+            elif group == "bot":
+                results += bench_bot(args.runs, workdir, args.model_latency)
+            elif group == "startup":
+                results += bench_startup(workdir)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import re
+
+from unit_registry import ALIAS_INDEX
+
+# Every spelling of each unit, so searching "km" also finds "kilometers"
+UNIT_SPELLINGS = {}
+for _alias, _unit in ALIAS_INDEX.items():
+    UNIT_SPELLINGS.setdefault(_unit, set()).add(_alias)
+
+TERM_PATTERN = re.compile(r"[\w.°]+")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class ChatIndex:
+    """Chat ids ordered most recent first, with lowercased titles for filtering
+
+    Built once from the chat metadata and reused across reruns until a chat is
+    added, renamed, updated or deleted, so paging the sidebar doesn't re-sort
+    every chat on each interaction.
+    """
+
+    def __init__(self, chats):
+        self.ids = sorted(chats, key=lambda chat_id: chats[chat_id]["updated_at"], reverse=True)
+        self.titles = [chats[chat_id]["name"].lower() for chat_id in self.ids]
+        self._last_search = ("", self.ids)
+
+    def search(self, text):
+        """Return the ids of chats whose title contains text, most recent first"""
+        text = text.strip().lower()
+        if text != self._last_search[0]:
+            matches = [chat_id for chat_id, title in zip(self.ids, self.titles) if text in title]
+            self._last_search = (text, matches)
+        return self._last_search[1]
+
+    def page(self, text, page, per_page):
+        """Return (ids on the page, number of pages) for a title filter"""
+        matches = self.search(text)
+        pages = max(1, -(-len(matches) // per_page))
+        page = min(max(page, 0), pages - 1)
+        return matches[page * per_page:(page + 1) * per_page], pages
+
+
+def _phrase(text):
+    """Quote text as an FTS5 phrase of its words, e.g. '3.5' -> '"3 5"'"""
+    words = WORD_PATTERN.findall(text.lower())
+    return '"' + " ".join(words) + '"' if words else None
+
+
+def search_expression(text):
+    """Turn a search box entry into an FTS5 query matching every term
+
+    The last term also matches as a prefix so results show up while typing,
+    and unit names match any of their spellings.
+    """
+    terms = TERM_PATTERN.findall(text)
+    clauses = []
+    for position, term in enumerate(terms):
+        phrase = _phrase(term)
+        if phrase is None:
+            continue
+        options = {phrase + "*" if position == len(terms) - 1 else phrase}
+        unit = ALIAS_INDEX.get(term.lower())
+        if unit:
+            options.update(filter(None, map(_phrase, UNIT_SPELLINGS[unit])))
+        clauses.append("(" + " OR ".join(sorted(options)) + ")")
+    return " AND ".join(clauses)
@@ -0,0 +1,394 @@
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:  # optional; archives fall back to gzip
+    zstandard = None
+
+# Background work like archiving reports its failures here
+logger = logging.getLogger("unitxchange.chat_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_upto INTEGER NOT NULL DEFAULT 0,
+    opened_at REAL NOT NULL DEFAULT 0,
+    archive TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_index USING fts5(
+    text, chat_id UNINDEXED, seq UNINDEXED
+);
+"""
+# Most search hits returned at once
+SEARCH_LIMIT = 10
+# Only the newest matches are ranked, which keeps common words fast on large histories
+SEARCH_CANDIDATES = 500
+# Archived chats are compressed with zstd when it is installed, otherwise gzip
+ARCHIVE_SUFFIX = ".json.zst" if zstandard else ".json.gz"
+
+
+class ChatStore:
+    """SQLite chat storage where each change writes only the rows it touches
+
+    Chats left unopened for a while can be moved to a cold tier: their messages
+    go to one compressed file per chat and are restored the next time the chat
+    is loaded or written to. The chats table keeps their metadata either way.
+    """
+
+    def __init__(self, path, archive_dir=None):
+        self.path = path
+        self.archive_dir = archive_dir or os.path.splitext(path)[0] + "_archive"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets several app processes read while one of them writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._build_search_index()
+
+    def create_chat(self, chat_id, name="New Chat"):
+        """Add an empty chat and return its metadata"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, name, now, now),
+            )
+        return {"name": name, "created_at": now, "updated_at": now, "message_count": 0}
+
+    def rename_chat(self, chat_id, name):
+        """Change the title of a chat"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chats SET name = ?, updated_at = ? WHERE id = ?",
+                (name, time.time(), chat_id),
+            )
+
+    def delete_chat(self, chat_id):
+        """Remove a chat and its messages"""
+        with self._lock, self._transaction():
+            row = self._conn.execute("SELECT archive FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM message_index WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+        if row and row[0]:
+            self._remove_archive(row[0])
+
+    def append_messages(self, chat_id, messages):
+        """Append messages ({"role", "text"} dicts) to the end of a chat"""
+        if not messages:
+            return
+        self._rehydrate(chat_id)
+        with self._lock, self._transaction():
+            row = self._conn.execute(
+                "SELECT message_count FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                now = time.time()
+                self._conn.execute(
+                    "INSERT INTO chats (id, name, created_at, updated_at) VALUES (?, 'New Chat', ?, ?)",
+                    (chat_id, now, now),
+                )
+                count = 0
+            else:
+                count = row[0]
+            rows = [
+                (chat_id, count + index, message["role"], message["text"])
+                for index, message in enumerate(messages)
+            ]
+            self._conn.executemany(
+                "INSERT INTO messages (chat_id, seq, role, text) VALUES (?, ?, ?, ?)", rows
+            )
+            # The search index is updated in the same transaction as the messages
+            self._index_messages(rows)
+            self._conn.execute(
+                "UPDATE chats SET message_count = ?, updated_at = ? WHERE id = ?",
+                (count + len(messages), time.time(), chat_id),
+            )
+
+    def load_messages(self, chat_id):
+        """Return the messages of one chat in order, restoring it from the archive if needed"""
+        self._rehydrate(chat_id)
+        with self._lock:
+            # Opening a chat keeps it out of the cold tier for another period
+            self._conn.execute("UPDATE chats SET opened_at = ? WHERE id = ?", (time.time(), chat_id))
+            rows = self._conn.execute(
+                "SELECT role, text FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)
+            ).fetchall()
+        return [{"role": role, "text": text} for role, text in rows]
+
+    def load_summary(self, chat_id):
+        """Return (summary, number of messages it covers) for a chat"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summary_upto FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+        return row if row else ("", 0)
+
+    def save_summary(self, chat_id, summary, summary_upto):
+        """Store the running summary of a chat's older messages"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chats SET summary = ?, summary_upto = ? WHERE id = ?",
+                (summary, summary_upto, chat_id),
+            )
+
+    def list_chats(self):
+        """Return {chat_id: metadata} for every chat, oldest first, without messages"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, created_at, updated_at, message_count, archive != '' FROM chats"
+                " ORDER BY created_at, id"
+            ).fetchall()
+        return {
+            chat_id: {
+                "name": name,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "message_count": message_count,
+                "archived": bool(archived),
+            }
+            for chat_id, name, created_at, updated_at, message_count, archived in rows
+        }
+
+    def archive_inactive(self, max_idle):
+        """Move chats not opened or updated for max_idle seconds to the cold tier
+
+        Only the message bodies move out; the search index keeps their rows so
+        archived chats still show up in message search. Returns the number of
+        chats archived.
+        """
+        cutoff = time.time() - max_idle
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT id, message_count FROM chats WHERE archive = '' AND message_count > 0"
+                " AND max(opened_at, updated_at) < ?",
+                (cutoff,),
+            ).fetchall()
+        archived = 0
+        for chat_id, message_count in candidates:
+            archive = self._archive_name(chat_id)
+            # Write the file first so a crash never leaves a chat without its messages
+            self._write_archive(archive, self._load_rows(chat_id))
+            with self._lock, self._transaction():
+                row = self._conn.execute(
+                    "SELECT message_count, archive FROM chats WHERE id = ?", (chat_id,)
+                ).fetchone()
+                moved = row == (message_count, "")
+                if moved:
+                    self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                    self._conn.execute("UPDATE chats SET archive = ? WHERE id = ?", (archive, chat_id))
+            if moved:
+                archived += 1
+            else:
+                # The chat changed while it was being written out; keep it hot
+                self._remove_archive(archive)
+        return archived
+
+
+    def archive_periodically(self, max_idle, interval):
+        """Archive inactive chats from a daemon thread now and then every interval seconds"""
+        def run():
+            while True:
+                try:
+                    self.archive_inactive(max_idle)
+                except (OSError, sqlite3.Error) as e:
+                    # Try again next time rather than stopping archiving for good
+                    logger.warning("Archiving chats failed: %s", e)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="chat-archiver", daemon=True)
+        thread.start()
+        return thread
+
+    def search_messages(self, match, limit=SEARCH_LIMIT, candidates=SEARCH_CANDIDATES):
+        """Return (chat_id, seq, snippet) for the messages best matching an FTS5 query, best first
+
+        Results are ranked by BM25 among the newest `candidates` matching messages.
+        """
+        with self._lock:
+            try:
+                return self._conn.execute(
+                    "SELECT chat_id, seq, snippet(message_index, 0, '', '', '…', 12)"
+                    " FROM message_index WHERE message_index MATCH ? AND rowid >= ("
+                    "  SELECT min(rowid) FROM (SELECT rowid FROM message_index"
+                    "  WHERE message_index MATCH ? ORDER BY rowid DESC LIMIT ?))"
+                    " ORDER BY rank LIMIT ?",
+                    (match, match, candidates, limit),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # Malformed query syntax; treat it as no matches
+                return []
+
+    def migrate_from_json(self, json_path):
+        """Import chats from the old JSON history file once"""
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+        if done:
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                chat_data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            chat_data = {}
+
+        now = time.time()
+        with self._lock, self._transaction():
+            # Another process may have finished the migration in the meantime
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+                return 0
+            for index, (chat_id, chat_info) in enumerate(chat_data.items()):
+                history = chat_info.get("history", [])
+                # Keep the file order by spacing creation times a millisecond apart
+                created_at = now + index * 0.001
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO chats (id, name, created_at, updated_at, message_count)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (chat_id, chat_info.get("name", "New Chat"), created_at, created_at, len(history)),
+                )
+                rows = [
+                    (chat_id, seq, message["role"], message["text"])
+                    for seq, message in enumerate(history)
+                ]
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO messages (chat_id, seq, role, text) VALUES (?, ?, ?, ?)", rows
+                )
+                self._index_messages(rows)
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (json_path,)
+            )
+        return len(chat_data)
+
+    def _load_rows(self, chat_id):
+        """Return (seq, role, text) rows of a chat's hot messages without marking it opened"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, role, text FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)
+            ).fetchall()
+
+    def _rehydrate(self, chat_id):
+        """Move an archived chat's messages back into the database"""
+        with self._lock:
+            row = self._conn.execute("SELECT archive FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        if not row or not row[0]:
+            return
+        archive = row[0]
+        with self._lock, self._transaction():
+            # Another process may have restored it in the meantime
+            if self._conn.execute(
+                "SELECT 1 FROM chats WHERE id = ? AND archive = ?", (chat_id, archive)
+            ).fetchone() is None:
+                return
+            rows = [(chat_id, seq, role, text) for seq, role, text in self._read_archive(archive)]
+            # The search index kept its rows while the chat was archived
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO messages (chat_id, seq, role, text) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.execute("UPDATE chats SET archive = '' WHERE id = ?", (chat_id,))
+        self._remove_archive(archive)
+
+    def _archive_name(self, chat_id):
+        """Return a file name for a chat's archive that is safe on every filesystem"""
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in chat_id)
+        return f"{safe_id}-{int(time.time())}{ARCHIVE_SUFFIX}"
+
+    def _write_archive(self, archive, rows):
+        """Compress a chat's (seq, role, text) rows into its archive file"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        data = json.dumps(rows).encode()
+        if archive.endswith(".zst"):
+            data = zstandard.ZstdCompressor(level=10).compress(data)
+        else:
+            data = gzip.compress(data, compresslevel=6)
+        path = os.path.join(self.archive_dir, archive)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _read_archive(self, archive):
+        """Return the (seq, role, text) rows stored in an archive file"""
+        with open(os.path.join(self.archive_dir, archive), "rb") as f:
+            data = f.read()
+        if archive.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"Chat archive {archive} needs the zstandard package")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        return json.loads(data)
+
+    def _remove_archive(self, archive):
+        try:
+            os.remove(os.path.join(self.archive_dir, archive))
+        except FileNotFoundError:
+            pass
+
+    def _index_messages(self, rows):
+        """Add (chat_id, seq, role, text) rows to the full-text index"""
+        self._conn.executemany(
+            "INSERT INTO message_index (text, chat_id, seq) VALUES (?, ?, ?)",
+            [(text, chat_id, seq) for chat_id, seq, _, text in rows],
+        )
+
+    def _build_search_index(self):
+        """Index the messages of databases created before full-text search existed"""
+        indexed = "SELECT 1 FROM meta WHERE key = 'search_index'"
+        if self._conn.execute(indexed).fetchone():
+            return
+        with self._lock, self._transaction():
+            # Another process may have built the index in the meantime
+            if self._conn.execute(indexed).fetchone():
+                return
+            self._conn.execute(
+                "INSERT INTO message_index (text, chat_id, seq) SELECT text, chat_id, seq FROM messages"
+            )
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('search_index', 'fts5')")
+
+    def _add_missing_columns(self):
+        """Upgrade chats tables created before the summary columns existed"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chats)")}
+        if "summary" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+        if "summary_upto" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN summary_upto INTEGER NOT NULL DEFAULT 0")
+        if "opened_at" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN opened_at REAL NOT NULL DEFAULT 0")
+        if "archive" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN archive TEXT NOT NULL DEFAULT ''")
+
+    @contextmanager
+    def _transaction(self):
+        """Group statements into one atomic write"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
@@ -0,0 +1,58 @@
+# Rough token estimate for Gemini text, about four characters per token
+CHARS_PER_TOKEN = 4
+# Summaries keep only this many of the most recent lines
+SUMMARY_MAX_LINES = 20
+SUMMARY_LINE_LENGTH = 80
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a piece of text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def recent_start(messages, max_messages, token_budget):
+    """Return the index of the oldest message that still fits in the window"""
+    start = len(messages)
+    tokens = 0
+    while start > 0 and len(messages) - start < max_messages:
+        cost = estimate_tokens(messages[start - 1]["text"])
+        if tokens + cost > token_budget:
+            break
+        tokens += cost
+        start -= 1
+    # Begin the window on a user message so the turns stay paired
+    while start < len(messages) and messages[start]["role"] != "user":
+        start += 1
+    return start
+
+
+def plan_fold(messages, summary_upto, max_messages, token_budget):
+    """Return how many leading messages should be covered by the summary"""
+    if recent_start(messages, max_messages, token_budget) <= summary_upto:
+        return summary_upto
+    # Fold down to half the window so the summary is refreshed every few turns, not every turn
+    return max(summary_upto, recent_start(messages, max_messages // 2, token_budget // 2))
+
+
+def summarize_turns(summary, messages):
+    """Fold messages into a short running summary without calling the model"""
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        text = " ".join(message["text"].split())
+        if len(text) > SUMMARY_LINE_LENGTH:
+            text = text[:SUMMARY_LINE_LENGTH].rstrip() + "..."
+        prefix = "User asked" if message["role"] == "user" else "Bot answered"
+        lines.append(f"- {prefix}: {text}")
+    return "\n".join(lines[-SUMMARY_MAX_LINES:])
+
+
+def build_history(summary, messages):
+    """Build Gemini chat history from a summary and the recent messages"""
+    history = []
+    if summary:
+        history.append({"role": "user", "parts": ["Summary of our earlier conversation:\n" + summary]})
+        history.append({"role": "model", "parts": ["Got it, I'll keep that in mind."]})
+    for message in messages:
+        role = "user" if message["role"] == "user" else "model"
+        history.append({"role": role, "parts": [message["text"]]})
+    return history
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+
+import numpy as np
+import tornado.ioloop
+import tornado.web
+from dotenv import load_dotenv
+
+from conversion_engine import MODEL_UNAVAILABLE, answer_query, build_strict_prompt, clean_strict_answer, parse_conversion
+from currency_rates import RateProvider
+from dimensions import COMPOUND, DimensionError, UnitExpressionError, apply_plan, compile_plan
+from response_cache import ResponseCache, make_cache_key
+from unit_registry import UNIT_LABELS, UNITS, category_of, convert, resolve_unit
+from upstream import TURN_BUDGET, Deadline, call_with_retries_async
+
+# Same files as the Streamlit apps so all of them start from the same warm caches
+RESPONSE_CACHE_FILE = "response_cache.db"
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_PORT = 8600
+MAX_BATCH_ITEMS = 100_000
+
+
+class ConversionError(ValueError):
+    """A request asked for units we can't convert between"""
+
+
+class ConversionService:
+    """Conversion logic behind the API, independent of Streamlit"""
+
+    def __init__(self, rate_provider=None, response_cache=None, turn_budget=TURN_BUDGET):
+        self.rate_provider = rate_provider or RateProvider()
+        self.response_cache = response_cache or ResponseCache(path=RESPONSE_CACHE_FILE)
+        self.turn_budget = turn_budget
+        self._models = {}
+
+    def resolve(self, name):
+        """Return (kind, unit) for a unit name or currency code"""
+        unit = resolve_unit(str(name))
+        if unit:
+            return "unit", unit
+        code = self.currency_code(name)
+        if code:
+            return "currency", code
+        raise ConversionError(f"Unknown unit '{name}'")
+
+    def currency_code(self, name):
+        """Return the currency code for name, or None if we have no rate for it"""
+        code = str(name).strip().upper()
+        return code if code in self.rate_provider.table else None
+
+    def convert_values(self, values, from_name, to_name):
+        """Convert a number or NumPy array, returning (result, category)"""
+        self.rate_provider.get_rates()
+        # Codes like CUP (Cuban peso) are also unit names; a pair of codes means currency
+        from_code, to_code = self.currency_code(from_name), self.currency_code(to_name)
+        if from_code and to_code:
+            return values * self.rate_provider.table.rate(from_code, to_code), "Currency"
+        try:
+            from_kind, from_unit = self.resolve(from_name)
+            to_kind, to_unit = self.resolve(to_name)
+        except ConversionError:
+            # Not a plain unit or currency: try unit expressions like "kg/m³" or "L/100km"
+            try:
+                return apply_plan(compile_plan(str(from_name), str(to_name)), values), COMPOUND
+            except (UnitExpressionError, DimensionError) as e:
+                raise ConversionError(str(e))
+        if from_kind == to_kind == "currency":
+            return values * self.rate_provider.table.rate(from_unit, to_unit), "Currency"
+        result = convert(values, from_unit, to_unit) if from_kind == to_kind else None
+        if result is None:
+            raise ConversionError(f"Can't convert {from_name} to {to_name}")
+        return result, category_of(from_unit)
+
+    def convert_to_currencies(self, values, from_name, to_names):
+        """Convert an array of amounts into several currencies, returning {code: converted array}"""
+        self.rate_provider.get_rates()
+        codes = []
+        for name in [from_name, *to_names]:
+            code = self.currency_code(name)
+            if code is None:
+                raise ConversionError(f"Unknown currency '{name}'")
+            codes.append(code)
+        # One amounts x currencies product from the cross-rate matrix
+        table = self.rate_provider.table.convert_table(values, codes[0], codes[1:])
+        return dict(zip(codes[1:], table.T))
+
+    def convert_batch(self, items):
+        """Convert many {value, from, to} items, grouping equal unit pairs into one array pass
+
+        A bad item only fails itself; the rest of its group is still converted.
+        """
+        results = [None] * len(items)
+        groups = {}
+        for position, item in enumerate(items):
+            try:
+                pair, value = parse_item(item)
+            except ConversionError as e:
+                results[position] = {"error": str(e)}
+                continue
+            positions, values = groups.setdefault(pair, ([], []))
+            positions.append(position)
+            values.append(value)
+        for (from_name, to_name), (positions, values) in groups.items():
+            try:
+                converted, category = self.convert_values(np.array(values), from_name, to_name)
+            except ConversionError as e:
+                for position in positions:
+                    results[position] = {"error": str(e)}
+                continue
+            for position, result in zip(positions, converted.tolist()):
+                if math.isfinite(result):
+                    results[position] = {"result": result, "category": category}
+                else:
+                    results[position] = {"error": "Result is not a finite number"}
+        return results
+
+    async def strict_answer(self, prompt, model_name=DEFAULT_MODEL):
+        """Answer like the bot's strict mode: locally, from the cache, or from Gemini
+
+        Gemini gets the same latency budget and retries as a bot turn; when it
+        fails or runs out of time the answer is MODEL_UNAVAILABLE from "fallback".
+        """
+        query = parse_conversion(prompt)
+        if not query:
+            raise ConversionError("Invalid format. Use: 'Convert X units to units'")
+        local_answer = answer_query(query)
+        if local_answer:
+            return local_answer, "local"
+        cache_key = make_cache_key(query, 0, model_name)
+        cached_answer = self.response_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer, "cache"
+        deadline = Deadline(self.turn_budget)
+        model = self._model(model_name)
+
+        def attempt(timeout):
+            return model.generate_content_async(build_strict_prompt(prompt), request_options={"timeout": timeout})
+
+        try:
+            # wait_for also ends a call that ignores its own timeout
+            response = await asyncio.wait_for(call_with_retries_async(attempt, deadline), deadline.remaining())
+            answer = clean_strict_answer(response.text)
+        except Exception:
+            return MODEL_UNAVAILABLE, "fallback"
+        self.response_cache.put(cache_key, answer)
+        return answer, "model"
+
+    def _model(self, model_name):
+        """Build a strict-mode Gemini model on first use"""
+        if model_name not in self._models:
+            import google.generativeai as gen_ai
+            gen_ai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            self._models[model_name] = gen_ai.GenerativeModel(
+                model_name, generation_config={"temperature": 0}
+            )
+        return self._models[model_name]
+
+
+def parse_item(item):
+    """Return ((from, to), value) for one batch item, or raise ConversionError"""
+    if not isinstance(item, dict):
+        raise ConversionError("Each item must be an object with 'value', 'from' and 'to'")
+    from_name, to_name = item.get("from"), item.get("to")
+    if not isinstance(from_name, str) or not isinstance(to_name, str):
+        raise ConversionError("'from' and 'to' must be strings")
+    try:
+        value = float(item["value"])
+    except KeyError:
+        raise ConversionError("Missing 'value'")
+    except (TypeError, ValueError):
+        raise ConversionError(f"Invalid value {item['value']!r}")
+    return (from_name, to_name), value
+
+
+def finite_or_none(values):
+    """Return a list of floats with inf and NaN results as None, which JSON can represent"""
+    return [value if math.isfinite(value) else None for value in values.tolist()]
+
+
+class JsonHandler(tornado.web.RequestHandler):
+    """Base handler that reads JSON bodies and writes JSON errors"""
+
+    def initialize(self, service):
+        self.service = service
+
+    def read_json(self):
+        try:
+            body = json.loads(self.request.body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+        return body
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+
+class ConvertHandler(JsonHandler):
+    def post(self):
+        body = self.read_json()
+        try:
+            value = float(body["value"])
+            result, category = self.service.convert_values(value, body["from"], body["to"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        if not math.isfinite(result):
+            # e.g. 0 mpg in L/100km; JSON has no infinity
+            raise tornado.web.HTTPError(400, reason="Result is not a finite number")
+        self.write({"value": value, "from": body["from"], "to": body["to"], "result": float(result), "category": category})
+
+
+class BatchConvertHandler(JsonHandler):
+    def post(self):
+        body = self.read_json()
+        if "values" in body:
+            # Fast path: one unit pair, or one currency into a list of currencies, for a whole array
+            try:
+                values = np.asarray(body["values"], dtype="float64")
+                if values.ndim != 1:
+                    raise ValueError("'values' must be a list of numbers")
+                if isinstance(body["to"], list):
+                    if not body["to"]:
+                        raise ValueError("'to' must name at least one currency")
+                    columns = self.service.convert_to_currencies(values, body["from"], body["to"])
+                    self.write({
+                        "results": {code: finite_or_none(column) for code, column in columns.items()},
+                        "category": "Currency",
+                    })
+                    return
+                result, category = self.service.convert_values(values, body["from"], body["to"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise tornado.web.HTTPError(400, reason=str(e))
+            self.write({"results": finite_or_none(result), "category": category})
+            return
+        items = body.get("items")
+        if not isinstance(items, list) or len(items) > MAX_BATCH_ITEMS:
+            raise tornado.web.HTTPError(400, reason=f"'items' must be a list of at most {MAX_BATCH_ITEMS}")
+        self.write({"results": self.service.convert_batch(items)})
+
+
+class StrictAnswerHandler(JsonHandler):
+    async def post(self):
+        body = self.read_json()
+        if not isinstance(body.get("prompt"), str):
+            raise tornado.web.HTTPError(400, reason="'prompt' must be a string")
+        try:
+            answer, source = await self.service.strict_answer(
+                body["prompt"], body.get("model", DEFAULT_MODEL)
+            )
+        except (KeyError, ConversionError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        self.write({"answer": answer, "source": source})
+
+
+class UnitsHandler(JsonHandler):
+    def get(self):
+        self.write({
+            category: [{"unit": unit, "label": UNIT_LABELS[unit]} for unit, _, _, _ in entries]
+            for category, entries in UNITS.items()
+        })
+
+
+def make_app(service=None):
+    """Build the tornado application around one shared ConversionService"""
+    service = service or ConversionService()
+    routes = [
+        (r"/convert", ConvertHandler),
+        (r"/convert/batch", BatchConvertHandler),
+        (r"/bot/strict", StrictAnswerHandler),
+        (r"/units", UnitsHandler),
+    ]
+    return tornado.web.Application([(path, handler, {"service": service}) for path, handler in routes])
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="unitXchange conversion API")
+    parser.add_argument("--port", type=int, default=int(os.getenv("CONVERSION_API_PORT", DEFAULT_PORT)))
+    args = parser.parse_args()
+    # HTTP/1.1 keep-alive is on by default, so clients can reuse connections
+    make_app().listen(args.port)
+    print(f"unitXchange API listening on http://localhost:{args.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
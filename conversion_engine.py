@@ -0,0 +1,206 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from dimensions import COMPOUND, DimensionError, UnitExpressionError, apply_plan, compile_plan, conversion_plan
+from fuzzy_units import correct_unit
+from unit_registry import ALIAS_INDEX, UNIT_SYMBOLS, category_of
+
+# Parsed form of a conversion question; category is None when the units don't match
+ConversionQuery = namedtuple('ConversionQuery', ['value', 'from_unit', 'to_unit', 'category'])
+
+# Plurals that are not formed by adding an 's'
+PLURALS = {
+    'foot': 'feet',
+    'foot per second': 'feet per second',
+    'inch': 'inches',
+    'meter per second': 'meters per second',
+    'kilometer per hour': 'kilometers per hour',
+    'mile per hour': 'miles per hour',
+    'psi': 'psi',
+}
+
+# All supported question shapes in one pattern so a prompt is scanned only once;
+# starting at a word boundary skips most positions inside long words cheaply
+NUMBER = r'-?\d+(?:\.\d+)?'
+# A unit ends at a word boundary that isn't the start of an expression like "ft/s" or "m²"
+UNIT = r'(?:deg(?:ree)?s?\s+)?([a-z°]+)(?![a-z°/^·*²³\d])'
+QUERY_PATTERN = re.compile(
+    r'\b(?:convert|what\s+is|change)\s+(' + NUMBER + r')\s*' + UNIT + r'\s+(?:to|into|in)\s+' + UNIT
+    + r'|\bhow\s+many\s+' + UNIT + r'\s+(?:are|is)\s+(?:in|there\s+in)\s+(' + NUMBER + r')\s*' + UNIT,
+    re.IGNORECASE,
+)
+# Questions about unit expressions such as "kg/m³", "kWh" or "L/100km"; an expression
+# never starts with a digit, so a long run of digits has only one way to split between
+# the number and the expression instead of one per position (quadratic backtracking)
+EXPRESSION = r'([^\s\d.,;?!][^\s,;?!]*(?:\s+per\s+[^\s,;?!]+)?)'
+COMPOUND_PATTERN = re.compile(
+    r'\b(?:convert|what\s+is|change)\s+(' + NUMBER + r')\s*' + EXPRESSION + r'\s+(?:to|into|in)\s+' + EXPRESSION,
+    re.IGNORECASE,
+)
+
+# What a user sees when Gemini can't answer in time and there is no local answer
+MODEL_UNAVAILABLE = "Sorry, I couldn't reach the model right now. Please try again in a moment."
+
+# Longer messages are not parsed as conversion questions; they go to the model as they are
+MAX_QUERY_LENGTH = 1000
+
+# Separators between conversions asked in one message, and the verb that starts one
+SPLIT_PATTERN = re.compile(r'\s*(?:[,;&]|\band\b|\bthen\b)\s*', re.IGNORECASE)
+VERB_PATTERN = re.compile(r'^\s*(?:convert|what\s+is|change|how\s+many)\b', re.IGNORECASE)
+
+
+def format_number(value):
+    """Format a number without trailing zeros"""
+    if value != 0 and abs(value) < 0.0001:
+        return f"{value:.6g}"
+    text = f"{value:.6f}".rstrip('0').rstrip('.')
+    return "0" if text == "-0" else text
+
+
+def unit_name(unit, value=2):
+    """Return the name of a unit for a value, e.g. 'foot', 'feet' or '°C'"""
+    if unit in UNIT_SYMBOLS:
+        return UNIT_SYMBOLS[unit]
+    if category_of(unit) is None:
+        # Unit expressions are shown as the user wrote them
+        return unit
+    if value == 1:
+        return unit
+    return PLURALS.get(unit, unit + 's')
+
+
+def format_quantity(value, unit):
+    """Format a value with its unit name, e.g. '1000 grams'"""
+    return f"{format_number(value)} {unit_name(unit, value)}"
+
+
+def describe_conversion(from_unit, to_unit):
+    """Return (formula, explanation) for converting between two units or unit expressions"""
+    scale, offset, reciprocal = conversion_plan(from_unit, to_unit)
+    from_name, to_name = unit_name(from_unit), unit_name(to_unit)
+    if reciprocal:
+        formula = f"{to_name} = {format_number(scale)} ÷ {from_name}"
+        explanation = f"Divide {format_number(scale)} by the value in {from_name}"
+    elif offset:
+        sign, step = ("+", "add") if offset > 0 else ("-", "subtract")
+        formula = f"{to_name} = ({from_name} × {format_number(scale)}) {sign} {format_number(abs(offset))}"
+        explanation = f"First multiply by {format_number(scale)}, then {step} {format_number(abs(offset))}"
+    else:
+        formula = f"1 {unit_name(from_unit, 1)} = {format_quantity(scale, to_unit)}"
+        explanation = f"Multiply {from_name} by {format_number(scale)} to get {to_name}"
+    return formula, explanation
+
+
+def parse_conversion(text):
+    """Parse a conversion question into a ConversionQuery, or return None
+
+    Questions with unknown unit names are retried as unit expressions and
+    then with misspelled names corrected.
+    """
+    if len(text) > MAX_QUERY_LENGTH:
+        return None
+    candidates = []
+    for match in QUERY_PATTERN.finditer(text):
+        value, from_name, to_name, how_many_to, how_many_value, how_many_from = match.groups()
+        if value is None:
+            value, from_name, to_name = how_many_value, how_many_from, how_many_to
+        from_unit = ALIAS_INDEX.get(from_name.lower())
+        to_unit = ALIAS_INDEX.get(to_name.lower())
+        if from_unit and to_unit:
+            category = category_of(from_unit)
+            if category != category_of(to_unit):
+                category = None
+            return ConversionQuery(float(value), from_unit, to_unit, category)
+        candidates.append((value, from_name, to_name))
+    return parse_compound(text) or parse_misspelled(candidates)
+
+
+def parse_compound(text):
+    """Parse a question about unit expressions, e.g. 'convert 5 kWh to MJ', or return None"""
+    for match in COMPOUND_PATTERN.finditer(text):
+        value, from_text, to_text = match.groups()
+        units = resolve_expressions(from_text.rstrip('.'), to_text.rstrip('.'))
+        if units:
+            return ConversionQuery(float(value), *units)
+    return None
+
+
+def parse_misspelled(candidates):
+    """Retry (value, from name, to name) matches with misspelled unit names corrected"""
+    for value, from_name, to_name in candidates:
+        from_text = correct_unit(from_name) or from_name
+        to_text = correct_unit(to_name) or to_name
+        if (from_text, to_text) == (from_name, to_name):
+            continue
+        units = resolve_expressions(from_text, to_text)
+        if units:
+            return ConversionQuery(float(value), *units)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def resolve_expressions(from_text, to_text):
+    """Return (from_unit, to_unit, category) for two unit expressions, or None if either isn't one
+
+    Registry spellings like "km/h" keep their registry unit and category; other
+    convertible pairs get the Compound category and mismatched ones None.
+    """
+    from_unit = ALIAS_INDEX.get(from_text.lower(), from_text)
+    to_unit = ALIAS_INDEX.get(to_text.lower(), to_text)
+    try:
+        compile_plan(from_unit, to_unit)
+    except UnitExpressionError:
+        return None
+    except DimensionError:
+        return from_unit, to_unit, None
+    category = category_of(from_unit)
+    if category is None or category != category_of(to_unit):
+        category = COMPOUND
+    return from_unit, to_unit, category
+
+
+def answer_query(query):
+    """Answer a parsed conversion query without the model, or return None"""
+    if query.category is None:
+        return None
+    result = apply_plan(conversion_plan(query.from_unit, query.to_unit), query.value)
+    return format_quantity(result, query.to_unit)
+
+
+def build_strict_prompt(prompt):
+    """Create a strict-mode prompt asking the model for just a number and unit"""
+    return (
+        "Respond with ONLY the number and unit. "
+        "No explanations, no additional text. "
+        "Example format: '1000 grams' or '100 meters'. "
+        "Question: " + prompt
+    )
+
+
+def clean_strict_answer(response):
+    """Reduce a model answer to just its first number and unit"""
+    # Clean the response to ensure it's just numbers and units
+    cleaned_response = re.sub(r'[^0-9\s.a-zA-Z°]', '', response)
+    # Extract just the first number and unit
+    match = re.search(r'(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)', cleaned_response)
+    if match:
+        return f"{match.group(1)} {match.group(2)}"
+    return cleaned_response.strip()
+
+
+def split_queries(text):
+    """Split a message with several conversions into one question each, or return [text]"""
+    if len(text) > MAX_QUERY_LENGTH:
+        return [text]
+    parts = [part for part in SPLIT_PATTERN.split(text) if part.strip()]
+    if len(parts) < 2:
+        return [text]
+    verb = VERB_PATTERN.match(parts[0])
+    verb = verb.group(0).strip() if verb else 'convert'
+    # Later parts usually drop the verb: "convert 5 km to miles and 3 lb to kg"
+    questions = [parts[0]] + [part if VERB_PATTERN.match(part) else f"{verb} {part}" for part in parts[1:]]
+    # Only split when every part is itself a conversion question
+    if all(COMPOUND_PATTERN.search(question) or QUERY_PATTERN.search(question) for question in questions):
+        return questions
+    return [text]
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Point this at a local server to run against stand-in rates
+RATES_URL = os.getenv("CURRENCY_RATES_URL", "https://api.exchangerate-api.com/v4/latest/USD")
+SNAPSHOT_FILE = "currency_rates.json"
+# Rates older than this are served while a background refresh runs
+MAX_AGE = 600
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (3, 10)
+# Wait this long after a failed refresh before trying again
+RETRY_DELAY = 60
+
+
+class RateTable:
+    """Cross rates for every currency pair, precomputed as a NumPy matrix"""
+
+    def __init__(self, rates):
+        self.codes = sorted(rates)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.rates = np.array([rates[code] for code in self.codes], dtype="float64")
+        # matrix[i, j] converts one unit of currency i into currency j
+        self.matrix = self.rates[None, :] / self.rates[:, None]
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def rate(self, from_code, to_code):
+        """Return how much one unit of from_code is worth in to_code"""
+        return float(self.matrix[self.index[from_code], self.index[to_code]])
+
+    def convert_to_all(self, amount, from_code):
+        """Return {code: converted amount} for every currency at once"""
+        row = amount * self.matrix[self.index[from_code]]
+        return dict(zip(self.codes, row.tolist()))
+
+    def convert_table(self, amounts, from_code, to_codes=None):
+        """Return an amounts x currencies array converting every amount into every currency"""
+        row = self.matrix[self.index[from_code]]
+        if to_codes is not None:
+            row = row[[self.index[code] for code in to_codes]]
+        return np.asarray(amounts, dtype="float64")[:, None] * row[None, :]
+
+
+class RateProvider:
+    """Serve the last good currency rates while refreshing them in the background"""
+
+    def __init__(self, url=RATES_URL, snapshot_path=SNAPSHOT_FILE, max_age=MAX_AGE, timeout=REQUEST_TIMEOUT):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.max_age = max_age
+        self.timeout = timeout
+        self.rates = {}
+        self.table = RateTable({})
+        self.fetched_at = 0.0
+        self.last_error = None
+        self._next_attempt = 0.0
+        self._session = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        if snapshot_path:
+            self._load_snapshot()
+
+    def get_rates(self):
+        """Return the latest rates at once, refreshing in the background if they are stale"""
+        if self.is_stale() and time.time() >= self._next_attempt:
+            self.refresh_async()
+        return self.rates
+
+    def is_stale(self):
+        """Check whether the rates are older than max_age"""
+        return time.time() - self.fetched_at > self.max_age
+
+    def is_refreshing(self):
+        """Check whether a background refresh is running"""
+        thread = self._refresh_thread
+        return thread is not None and thread.is_alive()
+
+    def refresh_async(self):
+        """Start a background refresh unless one is already running"""
+        with self._lock:
+            if self.is_refreshing():
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for a running background refresh to finish"""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def refresh(self):
+        """Fetch rates now; on failure keep serving the last good snapshot"""
+        # Imported here so loading the page doesn't wait for requests; refreshes
+        # normally run in a background thread
+        import requests
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            response = self._session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            rates = response.json().get("rates")
+            if not rates:
+                raise ValueError("response has no rates")
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = str(e)
+            self._next_attempt = time.time() + RETRY_DELAY
+            return False
+        self._set_rates(rates, time.time())
+        self.last_error = None
+        if self.snapshot_path:
+            self._save_snapshot()
+        return True
+
+    def _set_rates(self, rates, fetched_at):
+        """Swap in new rates and their cross-rate table so readers never see a half update"""
+        self.table = RateTable(rates)
+        self.rates = dict(rates)
+        self.fetched_at = fetched_at
+
+    def _load_snapshot(self):
+        """Start from the rates saved by the last successful refresh"""
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self._set_rates(snapshot.get("rates", {}), snapshot.get("fetched_at", 0.0))
+
+    def _save_snapshot(self):
+        """Write the current rates to disk for the next cold start"""
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"fetched_at": self.fetched_at, "rates": self.rates}, f)
+        os.replace(temp_path, self.snapshot_path)
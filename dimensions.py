@@ -0,0 +1,333 @@
+import math
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from unit_registry import ALIAS_INDEX, UNIT_FACTORS, category_of, conversion_factor
+
+# Category of queries and API results that use unit expressions like "kg/m³"
+COMPOUND = "Compound"
+
+# Exponents of the base dimensions, in this order
+BASE_DIMENSIONS = ("length", "mass", "time", "temperature", "current", "amount", "data")
+DIMENSIONLESS = (0,) * len(BASE_DIMENSIONS)
+
+
+def _dimension(**exponents):
+    return tuple(exponents.get(name, 0) for name in BASE_DIMENSIONS)
+
+
+LENGTH = _dimension(length=1)
+MASS = _dimension(mass=1)
+TIME = _dimension(time=1)
+ENERGY = _dimension(mass=1, length=2, time=-2)
+POWER = _dimension(mass=1, length=2, time=-3)
+FORCE = _dimension(mass=1, length=1, time=-2)
+PRESSURE = _dimension(mass=1, length=-1, time=-2)
+
+# Dimension and SI scale/offset of the first unit of each registry category
+CATEGORY_DIMENSIONS = {
+    "Distance": (LENGTH, 1.0, 0.0),
+    "Temperature": (_dimension(temperature=1), 1.0, 273.15),
+    "Weight": (MASS, 1.0, 0.0),
+    "Pressure": (PRESSURE, 1.0, 0.0),
+    "Time": (TIME, 1.0, 0.0),
+    "Volume": (_dimension(length=3), 0.001, 0.0),
+    "Area": (_dimension(length=2), 1.0, 0.0),
+    "Speed": (_dimension(length=1, time=-1), 1.0, 0.0),
+    "Data": (_dimension(data=1), 1.0, 0.0),
+}
+
+# Units beyond the registry: (symbols, names, SI scale, dimension)
+EXTRA_UNITS = [
+    (["N"], ["newton"], 1.0, FORCE),
+    (["J"], ["joule"], 1.0, ENERGY),
+    (["W"], ["watt"], 1.0, POWER),
+    (["Wh"], [], 3600.0, ENERGY),
+    (["cal"], ["calorie"], 4.184, ENERGY),
+    (["Btu", "BTU"], [], 1055.05585262, ENERGY),
+    (["eV"], ["electronvolt"], 1.602176634e-19, ENERGY),
+    (["hp"], ["horsepower"], 745.69987158227, POWER),
+    (["Hz"], ["hertz"], 1.0, _dimension(time=-1)),
+    (["rpm"], [], 1 / 60, _dimension(time=-1)),
+    (["A"], ["ampere", "amp"], 1.0, _dimension(current=1)),
+    (["V"], ["volt"], 1.0, _dimension(mass=1, length=2, time=-3, current=-1)),
+    (["mol"], ["mole"], 1.0, _dimension(amount=1)),
+    (["lbf"], [], 4.4482216152605, FORCE),
+    (["kgf"], [], 9.80665, FORCE),
+    (["mmHg"], [], 133.322387415, PRESSURE),
+    (["inHg"], [], 3386.389, PRESSURE),
+    (["cc"], [], 1e-6, _dimension(length=3)),
+    (["floz"], ["fluid ounce"], 2.95735295625e-5, _dimension(length=3)),
+    (["mpg"], [], 1609.344 / 3.785411784e-3, _dimension(length=-2)),
+    (["bit"], [], 0.125, _dimension(data=1)),
+]
+# Units that take SI prefixes ("kWh", "MJ", "µm", "kilojoule")
+PREFIXABLE = {"meter", "gram", "second", "liter", "pascal", "bar", "N", "J", "W", "Wh", "cal", "eV", "Hz", "A", "V", "mol"}
+PREFIXES = {
+    "Y": 1e24, "Z": 1e21, "E": 1e18, "P": 1e15, "T": 1e12, "G": 1e9, "M": 1e6, "k": 1e3, "h": 1e2, "da": 1e1,
+    "d": 1e-1, "c": 1e-2, "m": 1e-3, "µ": 1e-6, "μ": 1e-6, "u": 1e-6, "n": 1e-9, "p": 1e-12, "f": 1e-15,
+}
+PREFIX_NAMES = {
+    "yotta": 1e24, "zetta": 1e21, "exa": 1e18, "peta": 1e15, "tera": 1e12, "giga": 1e9, "mega": 1e6,
+    "kilo": 1e3, "hecto": 1e2, "deca": 1e1, "deci": 1e-1, "centi": 1e-2, "milli": 1e-3, "micro": 1e-6,
+    "nano": 1e-9, "pico": 1e-12, "femto": 1e-15,
+}
+SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺", "0123456789-+")
+# Words that act as operators: "kilometers per hour", "cubic feet", "meters squared"
+POWER_WORDS = {"square": 2, "sq": 2, "cubic": 3, "cu": 3}
+POWER_SUFFIXES = {"squared": 2, "cubed": 3}
+PLAN_CACHE_SIZE = 4096
+# Limits that keep hostile input like "km^99999" or thousands of "(" from overflowing
+MAX_EXPONENT = 12
+MAX_NESTING = 20
+
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)"
+    r"|(?P<power>(?:\^|\*\*)\s*[-+]?\d+|[⁻⁺]?[⁰¹²³⁴⁵⁶⁷⁸⁹]+)"
+    r"|(?P<word>[A-Za-z°µμ_]+)"
+    r"|(?P<op>[*/·×()]))"
+)
+
+# A unit expression reduced to SI: value_si = value * scale + offset
+Quantity = namedtuple("Quantity", ["scale", "offset", "dimension"])
+# How to convert between two expressions: value * scale + offset, or scale / value when reciprocal
+Plan = namedtuple("Plan", ["scale", "offset", "reciprocal"])
+
+
+class UnitExpressionError(ValueError):
+    """A unit expression couldn't be parsed"""
+
+
+class DimensionError(ValueError):
+    """Two unit expressions measure different things"""
+
+
+def _build_atoms():
+    """Map every accepted spelling of a unit to (Quantity, takes SI prefixes)"""
+    symbols, names = {}, {}
+    for alias, unit in ALIAS_INDEX.items():
+        dimension, base_scale, base_offset = CATEGORY_DIMENSIONS[category_of(unit)]
+        scale, offset = UNIT_FACTORS[unit]
+        names[alias] = (Quantity(scale * base_scale, offset * base_scale + base_offset, dimension), unit in PREFIXABLE)
+    for unit_symbols, unit_names, scale, dimension in EXTRA_UNITS:
+        atom = (Quantity(scale, 0.0, dimension), unit_symbols[0] in PREFIXABLE)
+        for symbol in unit_symbols:
+            symbols[symbol] = atom
+        for name in unit_names:
+            names[name] = names[name + "s"] = atom
+    # Lowercase symbols ("kwh") as a fallback, never shadowing a registry spelling
+    lowercase = {symbol.lower(): atom for symbol, atom in symbols.items() if symbol.lower() not in names}
+    return symbols, names, lowercase
+
+
+# Symbols are case-sensitive ("MJ" vs "mJ"); names and registry aliases are lowercase
+SYMBOLS, NAMES, LOWERCASE_SYMBOLS = _build_atoms()
+
+
+def _lookup_atom(word):
+    """Return the Quantity of one unit word, trying SI prefixes when it isn't a unit itself"""
+    lower = word.lower()
+    atom = SYMBOLS.get(word) or NAMES.get(lower) or LOWERCASE_SYMBOLS.get(lower)
+    if atom:
+        return atom[0]
+    for prefixes, text, tables in (
+        (PREFIXES, word, (SYMBOLS, NAMES)),
+        (PREFIX_NAMES, lower, (NAMES,)),
+        (PREFIXES, lower, (NAMES, LOWERCASE_SYMBOLS)),
+    ):
+        for prefix, factor in prefixes.items():
+            if not text.startswith(prefix) or len(text) == len(prefix):
+                continue
+            rest = text[len(prefix):]
+            atom = next((table[rest] for table in tables if rest in table), None)
+            if atom and atom[1]:
+                return Quantity(atom[0].scale * factor, 0.0, atom[0].dimension)
+    raise UnitExpressionError(f"Unknown unit '{word}'")
+
+
+def _multiply(left, right, sign=1):
+    """Combine two quantities; offsets are dropped because a compound unit measures differences"""
+    try:
+        scale = left.scale * right.scale ** sign
+    except ZeroDivisionError:
+        raise UnitExpressionError("Can't divide by zero")
+    return Quantity(scale, 0.0, tuple(a + sign * b for a, b in zip(left.dimension, right.dimension)))
+
+
+def _power(quantity, exponent):
+    if exponent == 1:
+        return quantity
+    try:
+        scale = quantity.scale ** exponent
+    except (OverflowError, ZeroDivisionError):
+        raise UnitExpressionError("Unit scale out of range")
+    return Quantity(scale, 0.0, tuple(d * exponent for d in quantity.dimension))
+
+
+class _Parser:
+    """Recursive-descent parser for products, quotients and powers of units"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        position = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            if match.start() != position:
+                break
+            kind = match.lastgroup
+            value = match.group(kind)
+            # Digits stuck to a unit are a power: "m3", "ft2"
+            if kind == "number" and self.tokens and self.tokens[-1][0] == "word" and match.start(kind) == position:
+                if value.isdigit():
+                    kind, value = "power", value
+            if kind == "word" and value.lower() == "per":
+                kind, value = "op", "/"
+            self.tokens.append((kind, value))
+            position = match.end()
+        if text[position:].strip():
+            raise UnitExpressionError(f"Can't read '{text[position:].strip()}' in '{text}'")
+        self.position = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise UnitExpressionError("Empty unit")
+        quantity = self.quotient()
+        if self.peek()[0] is not None:
+            raise UnitExpressionError(f"Unexpected '{self.peek()[1]}' in '{self.text}'")
+        # Float products overflow to inf or underflow to 0 instead of raising
+        if not math.isfinite(quantity.scale) or quantity.scale == 0:
+            raise UnitExpressionError(f"Unit scale out of range in '{self.text}'")
+        return quantity
+
+    def quotient(self):
+        quantity = self.product()
+        while self.peek() == ("op", "/"):
+            self.take()
+            quantity = _multiply(quantity, self.product(), -1)
+        return quantity
+
+    def product(self):
+        quantity = self.factor()
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in "*·×":
+                self.take()
+            elif not (kind in ("number", "word") or (kind, value) == ("op", "(")):
+                return quantity
+            quantity = _multiply(quantity, self.factor())
+
+    def factor(self):
+        kind, value = self.peek()
+        exponent = 1
+        if kind == "word" and value.lower() in POWER_WORDS:
+            self.take()
+            exponent = POWER_WORDS[value.lower()]
+        quantity = self.primary()
+        kind, value = self.peek()
+        if kind == "power":
+            self.take()
+            exponent *= int(value.translate(SUPERSCRIPTS).lstrip("^*").strip())
+        elif kind == "word" and value.lower() in POWER_SUFFIXES:
+            self.take()
+            exponent *= POWER_SUFFIXES[value.lower()]
+        if abs(exponent) > MAX_EXPONENT:
+            raise UnitExpressionError(f"Power {exponent} is too large in '{self.text}'")
+        return _power(quantity, exponent)
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "number":
+            return Quantity(float(value), 0.0, DIMENSIONLESS)
+        if kind == "word":
+            return _lookup_atom(value)
+        if (kind, value) == ("op", "("):
+            self.depth += 1
+            if self.depth > MAX_NESTING:
+                raise UnitExpressionError(f"Too many nested parentheses in '{self.text}'")
+            quantity = self.quotient()
+            if self.take() != ("op", ")"):
+                raise UnitExpressionError(f"Missing ')' in '{self.text}'")
+            self.depth -= 1
+            return quantity
+        raise UnitExpressionError(f"Expected a unit in '{self.text}'")
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def parse_unit(text):
+    """Parse a unit expression like 'kg/m³', 'kWh' or 'L/100km' into a Quantity"""
+    text = text.strip().rstrip(".")
+    # Whole registry spellings first, so "kilometers per hour" stays one unit
+    atom = NAMES.get(text.lower())
+    if atom:
+        return atom[0]
+    return _Parser(text).parse()
+
+
+def describe_dimension(dimension):
+    """Return a readable dimension, e.g. 'mass/length³'"""
+    if dimension == DIMENSIONLESS:
+        return "dimensionless"
+    superscript = str.maketrans("0123456789-", "⁰¹²³⁴⁵⁶⁷⁸⁹⁻")
+
+    def part(name, exponent):
+        return name + (str(exponent).translate(superscript) if exponent != 1 else "")
+
+    numerator = [part(name, e) for name, e in zip(BASE_DIMENSIONS, dimension) if e > 0]
+    denominator = [part(name, -e) for name, e in zip(BASE_DIMENSIONS, dimension) if e < 0]
+    text = "·".join(numerator) or "1"
+    return text + ("/" + "·".join(denominator) if denominator else "")
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_plan(from_text, to_text):
+    """Check dimensions and reduce a conversion between two expressions to one Plan
+
+    Plans are cached, so converting the same pair again is a single multiply-add.
+    Inverse dimensions, like L/100km and mpg, get a reciprocal plan.
+    """
+    source, target = parse_unit(from_text), parse_unit(to_text)
+    inverse = tuple(-d for d in target.dimension)
+    if source.dimension == target.dimension:
+        plan = Plan(source.scale / target.scale, (source.offset - target.offset) / target.scale, False)
+    elif source.dimension == inverse and not source.offset and not target.offset:
+        plan = Plan(1.0 / (source.scale * target.scale), 0.0, True)
+    else:
+        plan = None
+    if plan is not None:
+        if not math.isfinite(plan.scale) or plan.scale == 0 or not math.isfinite(plan.offset):
+            raise UnitExpressionError(f"Can't convert {from_text} to {to_text}: the scale is out of range")
+        return plan
+    raise DimensionError(
+        f"Can't convert {from_text} ({describe_dimension(source.dimension)}) "
+        f"to {to_text} ({describe_dimension(target.dimension)})"
+    )
+
+
+def conversion_plan(from_unit, to_unit):
+    """Return the Plan between two registry units or unit expressions"""
+    factor = conversion_factor(from_unit, to_unit)
+    if factor is not None:
+        return Plan(factor[0], factor[1], False)
+    return compile_plan(from_unit, to_unit)
+
+
+def apply_plan(plan, value):
+    """Convert a number or NumPy array with a Plan"""
+    if plan.reciprocal:
+        if not isinstance(value, np.ndarray):
+            return plan.scale / value if value else float("inf")
+        with np.errstate(divide="ignore"):
+            return plan.scale / value
+    return value * plan.scale + plan.offset
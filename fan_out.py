@@ -0,0 +1,118 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Most Gemini calls one message may have in flight at once
+MAX_CONCURRENT_CALLS = 4
+# Most Gemini calls the whole process may have in flight at once
+MAX_UPSTREAM_CALLS = int(os.getenv("MAX_UPSTREAM_CALLS", "8"))
+
+
+class AsyncRunner:
+    """Run coroutines on one background event loop shared by every session
+
+    The Gemini SDK keeps its async client bound to the loop that created it, so
+    all async calls go through this one long-lived loop instead of asyncio.run.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the shared loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+
+async def gather_limited(calls, limit=MAX_CONCURRENT_CALLS):
+    """Await coroutine factories with at most limit running at once, keeping their order
+
+    Failed calls return their exception instead of cancelling the others.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run_one(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run_one(call) for call in calls), return_exceptions=True)
+
+
+class SingleFlight:
+    """Share one upstream call between everyone asking the same question at the same time
+
+    Callers pass a key (e.g. the normalized cache key); while a call for that key is
+    running, identical requests wait for its result instead of making their own. All
+    calls, shared or not, also take a slot from one process-wide limit.
+    """
+
+    def __init__(self, max_calls=MAX_UPSTREAM_CALLS):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_calls)
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the process-wide upstream slots"""
+        with self._slots:
+            yield
+
+    def do(self, key, func, timeout=None):
+        """Return (func(), False), or (result, True) when an identical call was already running
+
+        timeout only bounds how long a caller waits for someone else's call.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(timeout), True
+        try:
+            with self._slots:
+                result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    async def do_async(self, key, make_coroutine):
+        """Async version of do for calls running on the shared event loop"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            if not self._slots.acquire(blocking=False):
+                # Wait for a slot off the loop so other calls keep running
+                await asyncio.get_running_loop().run_in_executor(None, self._slots.acquire)
+            try:
+                result = await make_coroutine()
+            finally:
+                self._slots.release()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    def _join(self, key):
+        """Return the future for key and whether this caller has to make the call"""
+        if key is None:
+            return Future(), True
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        """Hand the outcome to the waiters and let the next call for key go upstream"""
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
@@ -0,0 +1,109 @@
+import threading
+from functools import lru_cache
+
+from dimensions import NAMES
+
+# Accept a correction only within this many edits per letter (1 for "ounzes", 2 for "farenheit")
+FUZZY_RATIO = 0.25
+# Shorter words are too easy to confuse ("mi", "kn") to correct
+MIN_FUZZY_LENGTH = 4
+
+
+def _pattern(word):
+    """Precompute the bit masks of word for edit_distance"""
+    masks = {}
+    for position, char in enumerate(word):
+        masks[char] = masks.get(char, 0) | (1 << position)
+    return masks, (1 << len(word)) - 1, 1 << (len(word) - 1), len(word)
+
+
+def edit_distance(pattern, text):
+    """Levenshtein distance between a _pattern() and text
+
+    Uses Myers' bit-parallel algorithm: one pass over text with a few integer
+    operations per character, instead of filling a len(word) x len(text) table.
+    """
+    masks, full, last, score = pattern
+    plus, minus = full, 0
+    for char in text:
+        equal = masks.get(char, 0)
+        vertical = equal | minus
+        horizontal = (((equal & plus) + plus) ^ plus) | equal
+        horizontal_plus = minus | (~(horizontal | plus) & full)
+        horizontal_minus = plus & horizontal
+        if horizontal_plus & last:
+            score += 1
+        elif horizontal_minus & last:
+            score -= 1
+        horizontal_plus = ((horizontal_plus << 1) | 1) & full
+        horizontal_minus = (horizontal_minus << 1) & full
+        plus = horizontal_minus | (~(vertical | horizontal_plus) & full)
+        minus = horizontal_plus & vertical
+    return score
+
+
+class BKTree:
+    """Words arranged by edit distance so a lookup only visits nearby branches"""
+
+    def __init__(self, words):
+        words = iter(words)
+        self.root = (next(words), {})
+        for word in words:
+            pattern = _pattern(word)
+            node = self.root
+            while True:
+                distance = edit_distance(pattern, node[0])
+                child = node[1].get(distance)
+                if child is None:
+                    node[1][distance] = (word, {})
+                    break
+                node = child
+
+    def search(self, word, max_distance):
+        """Return (distance, word) for every word within max_distance edits"""
+        pattern = _pattern(word)
+        matches, stack = [], [self.root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(pattern, node_word)
+            if distance <= max_distance:
+                matches.append((distance, node_word))
+            # By the triangle inequality only these branches can hold a match
+            for child_distance in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(child_distance)
+                if child is not None:
+                    stack.append(child)
+        return matches
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_unit_tree():
+    """Return the BK-tree of unit spellings, built on first use"""
+    global _tree
+    with _tree_lock:
+        if _tree is None:
+            _tree = BKTree(sorted(name for name in NAMES if name.isalpha() and len(name) >= MIN_FUZZY_LENGTH))
+        return _tree
+
+
+@lru_cache(maxsize=4096)
+def correct_unit(word):
+    """Return the unit spelling closest to a misspelled word, or None if no unit is close enough
+
+    A correction is only made when every spelling at the best distance names
+    the same unit, e.g. "kilometrs" is as close to "kilometers" as to "kilometres".
+    """
+    word = word.lower()
+    if len(word) < MIN_FUZZY_LENGTH:
+        return None
+    matches = get_unit_tree().search(word, int(len(word) * FUZZY_RATIO))
+    if not matches:
+        return None
+    best = min(distance for distance, _ in matches)
+    spellings = sorted(spelling for distance, spelling in matches if distance == best)
+    if len({NAMES[spelling][0] for spelling in spellings}) > 1:
+        return None
+    return spellings[0]
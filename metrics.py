@@ -0,0 +1,153 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# One JSON line per turn; the file rolls over at MAX_BYTES keeping BACKUP_COUNT old files
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.jsonl")
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+# Set METRICS_PORT to serve Prometheus text at http://host:port/metrics
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "unitxchange"
+
+
+class Metrics:
+    """Span timings and counters, kept in memory and exported as Prometheus text or JSONL
+
+    Spans inside a turn() are also written as one JSON line when the turn ends.
+    The current turn is a context variable, so work started with a copy of the
+    caller's context (see upstream.hedged) is counted in the caller's turn.
+    Recording is a few dict updates under a lock, cheap enough to leave on.
+    """
+
+    def __init__(self, path=METRICS_FILE, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+        self.counters = {}
+        self.histograms = {}  # span -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+        self._turn = contextvars.ContextVar(f"{PREFIX}_turn_{id(self)}", default=None)
+        self._log = None
+        if path:
+            # A private logger gives us rotation and thread-safe writes for free
+            self._log = logging.getLogger(f"{PREFIX}.metrics.{id(self)}")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log.addHandler(handler)
+
+    def incr(self, name, amount=1):
+        """Add to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            turn = self._turn.get()
+            if turn is not None:
+                turn["counters"][name] = turn["counters"].get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        """Record one duration of a span"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += 1
+            histogram[-1] += seconds
+            turn = self._turn.get()
+            if turn is not None:
+                turn["spans"][name] = round(turn["spans"].get(name, 0.0) + seconds, 6)
+
+    @contextmanager
+    def span(self, name):
+        """Time the body of a with block as one span"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextmanager
+    def turn(self, kind, **fields):
+        """Group the spans and counters of one turn and log them as a JSON line at the end"""
+        record = {"kind": kind, "ts": time.time(), "spans": {}, "counters": {}, **fields}
+        token = self._turn.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self._turn.reset(token)
+            total = time.perf_counter() - start
+            self.observe(f"{kind}_turn", total)
+            record["total"] = round(total, 6)
+            if self._log is not None:
+                self._log.info(json.dumps(record))
+
+    def render_prometheus(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: list(values) for name, values in self.histograms.items()}
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {PREFIX}_{name}_total counter", f"{PREFIX}_{name}_total {value}"]
+        if histograms:
+            metric = f"{PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, values in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, values):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {values[-2]}')
+                lines.append(f'{metric}_count{{span="{name}"}} {values[-2]}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {values[-1]:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve /metrics in Prometheus text format from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide Metrics shared by the bot and the converter page"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            if METRICS_PORT:
+                _metrics.serve(int(METRICS_PORT))
+        return _metrics
@@ -1,6 +1,14 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import requests
+from currency_rates import RateProvider
+from dimensions import COMPOUND, DimensionError, UnitExpressionError, apply_plan, compile_plan
+from batch_convert import convert_csv, pasted_column_to_csv, read_and_remove, read_columns
+from metrics import get_metrics
+from unit_registry import CATEGORIES, LABEL_INDEX, conversion_factor, convert, unit_labels
+
+# The page is split into fragments (converter, batch, history, currency controls) so
+# a click only reruns its own region; the styling and title below are only sent on a
+# full page load.
 
 # Initialize session state for history and clear button if not already done
 if 'history' not in st.session_state:
@@ -9,111 +17,67 @@ if 'clear_clicked' not in st.session_state:
     st.session_state.clear_clicked = False
 
 def clear_history_callback():
+    # Runs before the history fragment reruns, so no extra rerun is needed to show the change
+    st.session_state.history = []
     st.session_state.clear_clicked = True
 
-# Cache the currency API response for 10 minutes
-@st.cache_data(ttl=600)
-def fetch_currency_rates():
-    try:
-        response = requests.get("https://api.exchangerate-api.com/v4/latest/USD")
-        return response.json().get("rates", {})
-    except Exception as e:
-        st.error("Error fetching currency rates")
-        return {}
+# One rate provider per process; it refreshes in the background and never blocks a rerun
+@st.cache_resource
+def get_rate_provider():
+    return RateProvider()
+
+# Unit labels for each registry category, built once per process
+@st.cache_resource
+def get_unit_options():
+    return {category: unit_labels(category) for category in CATEGORIES}
+
+# Popular currencies first, then every other currency the rate API returned
+@st.cache_data(max_entries=4)
+def currency_options(codes):
+    return POPULAR_CURRENCIES + [code for code in codes if code not in POPULAR_CURRENCIES]
 
 # Conversion functions
-def distance_converter(from_unit, to_unit, value):
-    units = {
-        "Meters": 1,
-        "Kilometers": 1000,
-        "Feet": 0.3048,
-        "Miles": 1609.34,
-        "Yards": 0.9144,
-        "Inches": 0.0254
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def temperature_converter(from_unit, to_unit, value):
-    if from_unit == "Celsius" and to_unit == "Fahrenheit":
-        return (value * 9/5) + 32
-    elif from_unit == "Fahrenheit" and to_unit == "Celsius":
-        return (value - 32) * 5/9
-    return value
-
-def weight_converter(from_unit, to_unit, value):
-    units = {
-        "Kilograms": 1,
-        "Grams": 0.001,
-        "Pounds": 0.453592,
-        "Ounces": 0.0283495,
-        "Stones": 6.35029
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def pressure_converter(from_unit, to_unit, value):
-    units = {
-        "Pascals": 1,
-        "Hectopascals": 100,
-        "Kilopascals": 1000,
-        "Bar": 100000,
-        "Atmospheres": 101325
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def currency_converter(from_unit, to_unit, value, rates):
-    return value * rates[to_unit] / rates[from_unit]
-
-def time_converter(from_unit, to_unit, value):
-    units = {
-        "Seconds": 1,
-        "Minutes": 60,
-        "Hours": 3600,
-        "Days": 86400,
-        "Weeks": 604800,
-        "Months": 2628000
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def volume_converter(from_unit, to_unit, value):
-    units = {
-        "Liters": 1,
-        "Milliliters": 0.001,
-        "Gallons": 3.78541,
-        "Cups": 0.236588,
-        "Cubic Meters": 1000
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def area_converter(from_unit, to_unit, value):
-    units = {
-        "Square Meters": 1,
-        "Square Kilometers": 1e6,
-        "Acres": 4046.86,
-        "Hectares": 10000
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def speed_converter(from_unit, to_unit, value):
-    units = {
-        "Meters per second": 1,
-        "Kilometers per hour": 0.277778,
-        "Miles per hour": 0.44704,
-        "Knots": 0.514444
-    }
-    return value * units[from_unit] / units[to_unit]
-
-def data_converter(from_unit, to_unit, value):
-    units = {
-        "Bytes": 1,
-        "Kilobytes": 1024,
-        "Megabytes": 1024**2,
-        "Gigabytes": 1024**3,
-        "Terabytes": 1024**4
-    }
-    return value * units[from_unit] / units[to_unit]
+def currency_converter(from_unit, to_unit, value, rate_table):
+    return value * rate_table.rate(from_unit, to_unit)
 
-# Fetch real-time currency rates
-currency_rates = fetch_currency_rates()
+def batch_converter(category, from_unit, to_unit, rate_table):
+    """Return a function that converts a whole NumPy array between the selected units"""
+    if category == "Currency":
+        return lambda values: currency_converter(from_unit, to_unit, values, rate_table)
+    if category == COMPOUND:
+        plan = compile_plan(from_unit, to_unit)
+        return lambda values: apply_plan(plan, values)
+    # Registry conversions are a multiply-add, so they work on arrays element-wise
+    from_key, to_key = LABEL_INDEX[from_unit], LABEL_INDEX[to_unit]
+    return lambda values: convert(values, from_key, to_key)
+
+# Category selection with icons
+CATEGORY_ICONS = {
+    "Distance": "📏",
+    "Temperature": "🌡️",
+    "Weight": "⚖️",
+    "Pressure": "🎯",
+    "Currency": "💱",
+    "Time": "⏰",
+    "Volume": "🧪",
+    "Area": "📐",
+    "Speed": "🚀",
+    "Data": "💾",
+    COMPOUND: "🧮"
+}
+POPULAR_CURRENCIES = ["USD", "EUR", "INR", "JPY", "GBP", "AUD", "PKR"]
+
+# Categories come from the unit registry, with currency added after pressure
+categories = list(CATEGORIES)
+categories.insert(categories.index("Pressure") + 1, "Currency")
+# Free-form unit expressions such as kg/m³, kWh or L/100km
+categories.append(COMPOUND)
+
+# Span timings and counters shared with the bot
+metrics = get_metrics()
+
+# Latest currency rates (possibly a few minutes old while a refresh runs)
+rate_provider = get_rate_provider()
 
 # Enhanced CSS styling
 st.markdown(
@@ -272,180 +236,237 @@ st.markdown("""
     </p>
 """, unsafe_allow_html=True)
 
-# Wrap the conversion UI in a container card
-st.markdown("<div class='converter-container'>", unsafe_allow_html=True)
 
-# Category selection with icons
-category_icons = {
-    "Distance": "📏",
-    "Temperature": "🌡️",
-    "Weight": "⚖️",
-    "Pressure": "🎯",
-    "Currency": "💱",
-    "Time": "⏰",
-    "Volume": "🧪",
-    "Area": "📐",
-    "Speed": "🚀",
-    "Data": "💾"
-}
+def available_rate_table(from_unit, to_unit):
+    """Return a rate table with both currencies, or show an error and return None"""
+    rate_table = rate_provider.table
+    if from_unit not in rate_table or to_unit not in rate_table:
+        # No snapshot yet; give the first background fetch a moment to land
+        metrics.incr("rate_waits")
+        with metrics.span("rates_wait"):
+            rate_provider.refresh_async()
+            rate_provider.wait(timeout=3)
+        rate_table = rate_provider.table
+    if from_unit not in rate_table or to_unit not in rate_table:
+        metrics.incr("rates_unavailable")
+        st.error("Currency rates are not available yet. Please try again in a moment.")
+        return None
+    return rate_table
 
-# Updated list of categories
-categories = ["Distance", "Temperature", "Weight", "Pressure", "Currency", "Time", "Volume", "Area", "Speed", "Data"]
-category = st.selectbox(
-    "Select Category",
-    categories,
-    format_func=lambda x: f"{category_icons[x]} {x}"
-)
+def show_conversion(category, from_unit, to_unit, value, show_all_currencies):
+    """Convert value, write the formula and result, and add it to the history"""
+    icon = CATEGORY_ICONS[category]
+    if category == "Currency":
+        rate_table = available_rate_table(from_unit, to_unit)
+        if rate_table is None:
+            return
+        with metrics.span("convert"):
+            factor = rate_table.rate(from_unit, to_unit)
+            result = value * factor
+        st.write(f"{icon} Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
+        st.write("Note: Currency rates are fetched in real-time")
+        if show_all_currencies:
+            # One row of the cross-rate matrix converts the amount into every currency
+            all_amounts = rate_table.convert_to_all(value, from_unit)
+            st.dataframe(
+                {"Currency": list(all_amounts), "Amount": list(all_amounts.values())},
+                hide_index=True
+            )
+    elif category == COMPOUND:
+        # Dimensions are checked once per unit pair and the plan is cached after that
+        try:
+            with metrics.span("convert"):
+                plan = compile_plan(from_unit, to_unit)
+                result = float(apply_plan(plan, value))
+        except (UnitExpressionError, DimensionError) as e:
+            st.error(str(e))
+            return
+        if plan.reciprocal:
+            st.write(f"{icon} Formula: {plan.scale:.6g} ÷ {value} {from_unit} = {result:.6g} {to_unit}")
+        elif plan.offset:
+            sign = "+" if plan.offset > 0 else "-"
+            st.write(f"{icon} Formula: ({value} {from_unit} × {plan.scale:.6g}) {sign} {abs(plan.offset):.6g} = {result:.6g} {to_unit}")
+        else:
+            st.write(f"{icon} Formula: {value} {from_unit} × {plan.scale:.6g} = {result:.6g} {to_unit}")
+    else:
+        # One lookup in the registry's precomputed matrices gives the whole conversion
+        with metrics.span("convert"):
+            factor, offset = conversion_factor(LABEL_INDEX[from_unit], LABEL_INDEX[to_unit])
+            result = value * factor + offset
+        if offset:
+            sign = "+" if offset > 0 else "-"
+            st.write(f"{icon} Formula: ({value} {from_unit} × {factor:.4f}) {sign} {abs(offset):.2f} = {result:.2f} {to_unit}")
+        else:
+            st.write(f"{icon} Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
 
-# Unit options for each category
-unit_options = {
-    "Distance": ["Meters", "Kilometers", "Feet", "Miles", "Yards", "Inches"],
-    "Temperature": ["Celsius", "Fahrenheit"],
-    "Weight": ["Kilograms", "Grams", "Pounds", "Ounces", "Stones"],
-    "Pressure": ["Pascals", "Hectopascals", "Kilopascals", "Bar", "Atmospheres"],
-    "Currency": ["USD", "EUR", "INR", "JPY", "GBP", "AUD", "PKR"],
-    "Time": ["Seconds", "Minutes", "Hours", "Days", "Weeks", "Months"],
-    "Volume": ["Liters", "Milliliters", "Gallons", "Cups", "Cubic Meters"],
-    "Area": ["Square Meters", "Square Kilometers", "Acres", "Hectares"],
-    "Speed": ["Meters per second", "Kilometers per hour", "Miles per hour", "Knots"],
-    "Data": ["Bytes", "Kilobytes", "Megabytes", "Gigabytes", "Terabytes"]
-}
+    # Enhanced result display; expression results can be very large or small
+    result_text = f"{result:.6g}" if category == COMPOUND else f"{result:.2f}"
+    with metrics.span("render"):
+        st.markdown(f"""
+            <div style='text-align: center; padding: 20px; background: rgba(76, 175, 80, 0.1); border-radius: 10px; margin: 20px 0; box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);'>
+                <span style='font-size: 24px; color: #2e7d32; font-weight: 500;'>
+                    {value} {from_unit} = {result_text} {to_unit}
+                </span>
+            </div>
+        """, unsafe_allow_html=True)
+
+    st.session_state.history.append(f"{value} {from_unit} → {result_text} {to_unit}")
 
-from_unit = st.selectbox("From", unit_options[category])
-to_unit = st.selectbox("To", unit_options[category])
-value = st.number_input("Enter Value", min_value=0.0, format="%.2f")
-
-# Center the convert button
-st.markdown("<div style='text-align: center;'>", unsafe_allow_html=True)
-convert_button = st.button("Convert")
-st.markdown("</div>", unsafe_allow_html=True)
-
-if convert_button:
-    if category == "Distance":
-        result = distance_converter(from_unit, to_unit, value)
-        factor = distance_converter(from_unit, to_unit, 1)
-        st.write(f"📏 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Temperature":
-        result = temperature_converter(from_unit, to_unit, value)
-        if from_unit == "Celsius" and to_unit == "Fahrenheit":
-            formula = f"({value}°C × 9/5) + 32 = {result:.2f}°F"
-        elif from_unit == "Fahrenheit" and to_unit == "Celsius":
-            formula = f"({value}°F - 32) × 5/9 = {result:.2f}°C"
+@st.fragment
+def converter():
+    """Unit pickers, the convert button and its result; reruns on its own when they change"""
+    # Wrap the conversion UI in a container card
+    st.markdown("<div class='converter-container'>", unsafe_allow_html=True)
+
+    category = st.selectbox(
+        "Select Category",
+        categories,
+        format_func=lambda x: f"{CATEGORY_ICONS[x]} {x}"
+    )
+    if category == COMPOUND:
+        from_unit = st.text_input("From", "kg/m³", help="Products, quotients and powers of units, e.g. kWh, m/s², L/100km")
+        to_unit = st.text_input("To", "lb/ft³")
+    else:
+        if category == "Currency":
+            rate_provider.get_rates()
+            options = currency_options(rate_provider.table.codes)
         else:
-            formula = f"{value}°{from_unit} = {result:.2f}°{to_unit}"
-        st.write(f"🌡️ Formula: {formula}")
-    elif category == "Weight":
-        result = weight_converter(from_unit, to_unit, value)
-        factor = weight_converter(from_unit, to_unit, 1)
-        st.write(f"⚖️ Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Pressure":
-        result = pressure_converter(from_unit, to_unit, value)
-        factor = pressure_converter(from_unit, to_unit, 1)
-        st.write(f"🎯 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Currency":
-        result = currency_converter(from_unit, to_unit, value, currency_rates)
-        factor = currency_converter(from_unit, to_unit, 1, currency_rates)
-        st.write(f"💱 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-        st.write("Note: Currency rates are fetched in real-time")
-    elif category == "Time":
-        result = time_converter(from_unit, to_unit, value)
-        factor = time_converter(from_unit, to_unit, 1)
-        st.write(f"⏰ Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Volume":
-        result = volume_converter(from_unit, to_unit, value)
-        factor = volume_converter(from_unit, to_unit, 1)
-        st.write(f"🧪 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Area":
-        result = area_converter(from_unit, to_unit, value)
-        factor = area_converter(from_unit, to_unit, 1)
-        st.write(f"📐 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Speed":
-        result = speed_converter(from_unit, to_unit, value)
-        factor = speed_converter(from_unit, to_unit, 1)
-        st.write(f"🚀 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    elif category == "Data":
-        result = data_converter(from_unit, to_unit, value)
-        factor = data_converter(from_unit, to_unit, 1)
-        st.write(f"💾 Formula: {value} {from_unit} × {factor:.4f} = {result:.2f} {to_unit}")
-    
-    # Enhanced result display
-    st.markdown(f"""
-        <div style='text-align: center; padding: 20px; background: rgba(76, 175, 80, 0.1); border-radius: 10px; margin: 20px 0; box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);'>
-            <span style='font-size: 24px; color: #2e7d32; font-weight: 500;'>
-                {value} {from_unit} = {result:.2f} {to_unit}
-            </span>
+            options = get_unit_options()[category]
+        from_unit = st.selectbox("From", options)
+        to_unit = st.selectbox("To", options)
+    value = st.number_input("Enter Value", min_value=0.0, format="%.2f")
+    show_all_currencies = category == "Currency" and st.checkbox("Show in all currencies")
+
+    # Center the convert button
+    st.markdown("<div style='text-align: center;'>", unsafe_allow_html=True)
+    convert_button = st.button("Convert")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    if convert_button:
+        with metrics.turn("converter", category=category):
+            show_conversion(category, from_unit, to_unit, value, show_all_currencies)
+
+    st.markdown("</div>", unsafe_allow_html=True)  # End of converter container
+
+    batch_conversion(category, from_unit, to_unit)
+    conversion_history(category)
+
+@st.fragment
+def batch_conversion(category, from_unit, to_unit):
+    """Batch conversion of a whole CSV column or a pasted list of values"""
+    with st.expander("📂 Batch Conversion"):
+        st.write(f"Converts every value from **{from_unit}** to **{to_unit}** using the units selected above.")
+        batch_source = st.radio("Input", ["Upload CSV", "Paste values"], horizontal=True)
+        if batch_source == "Upload CSV":
+            uploaded_file = st.file_uploader("CSV file", type=["csv"])
+            batch_file = uploaded_file
+        else:
+            pasted_values = st.text_area("One value per line")
+            batch_file = pasted_column_to_csv(pasted_values) if pasted_values.strip() else None
+
+        if batch_file is not None:
+            batch_column = st.selectbox("Column to convert", read_columns(batch_file))
+            if st.button("Convert Batch"):
+                rate_table = None
+                if category == "Currency":
+                    rate_table = available_rate_table(from_unit, to_unit)
+                    if rate_table is None:
+                        return
+                try:
+                    converter = batch_converter(category, from_unit, to_unit, rate_table)
+                except (UnitExpressionError, DimensionError) as e:
+                    st.error(str(e))
+                    return
+                with metrics.turn("batch", category=category), metrics.span("batch_convert"):
+                    output_path, row_count, preview = convert_csv(
+                        batch_file,
+                        batch_column,
+                        converter,
+                        f"{batch_column} ({to_unit})"
+                    )
+                    metrics.incr("batch_rows", row_count)
+                st.success(f"Converted {row_count:,} rows")
+                if preview is not None:
+                    st.dataframe(preview)
+                # The download button keeps its data in memory, so the temporary file can go
+                st.download_button(
+                    "⬇️ Download Results",
+                    read_and_remove(output_path),
+                    file_name="converted.csv",
+                    mime="text/csv"
+                )
+
+@st.fragment
+def conversion_history(category):
+    """Recent conversions with the clear button; clearing only reruns this fragment"""
+    st.markdown("""
+        <div style='margin-top: 30px;'>
+            <h2 style='color: #1a73e8; font-size: 28px; margin-bottom: 20px;'>
+                🕒 Recent Conversions
+            </h2>
         </div>
     """, unsafe_allow_html=True)
-    
-    st.session_state.history.append(f"{value} {from_unit} → {result:.2f} {to_unit}")
 
-st.markdown("</div>", unsafe_allow_html=True)  # End of converter container
+    if st.session_state.clear_clicked:
+        st.session_state.clear_clicked = False
+        st.success("Conversion history cleared!")
 
-# Enhanced History Display - FIXED VERSION
-st.markdown("""
-    <div style='margin-top: 30px;'>
-        <h2 style='color: #1a73e8; font-size: 28px; margin-bottom: 20px;'>
-            🕒 Recent Conversions
-        </h2>
-    </div>
-""", unsafe_allow_html=True)
-
-# Check if clear was clicked and clear the history
-if st.session_state.clear_clicked:
-    st.session_state.history = []
-    st.session_state.clear_clicked = False
-    st.success("Conversion history cleared!")
-    st.rerun()
-
-# Display history and buttons - FIXED to eliminate white space
-if st.session_state.history:
-    # Container for history items
-    history_container = st.container()
-    with history_container:
+    # Display history and buttons - FIXED to eliminate white space
+    if st.session_state.history:
+        # Container for history items
+        history_container = st.container()
+        with history_container:
+            st.markdown("""
+                <div style='background: rgba(255, 255, 255, 0.9); 
+                            padding: 2px; 
+                            border-radius: 15px; 
+                            box-shadow: 0 4px 16px rgba(0, 0, 0, 0.08); 
+                            border: 1px solid rgba(255, 255, 255, 0.18);
+                            margin-bottom: 20px;'>
+            """, unsafe_allow_html=True)
+            
+            for item in st.session_state.history[::-1][:10]:
+                st.markdown(f"""
+                    <div style='padding: 12px;
+                                margin: 8px 0;
+                                background: rgba(240, 242, 246, 0.5);
+                                border-radius: 8px;
+                                transition: all 0.3s ease;
+                                border: 1px solid rgba(0, 0, 0, 0.05);'>
+                        ➜ {item}
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        # Buttons for history actions
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button("🗑️ Clear History", on_click=clear_history_callback)
+        with col2:
+            if category == "Currency":
+                currency_controls()
+    else:
+        # No empty space between heading and info message
         st.markdown("""
-            <div style='background: rgba(255, 255, 255, 0.9); 
-                        padding: 2px; 
-                        border-radius: 15px; 
+            <div style='background: rgba(240, 248, 255, 0.9); 
+                        padding: 20px; 
+                        border-radius: 10px; 
                         box-shadow: 0 4px 16px rgba(0, 0, 0, 0.08); 
-                        border: 1px solid rgba(255, 255, 255, 0.18);
-                        margin-bottom: 20px;'>
+                        border: 1px solid rgba(230, 240, 250, 0.8);
+                        margin-top: 10px;
+                        margin-bottom: 10px;'>
+                <p style='text-align: center; color: #1a73e8; font-size: 24px;'>
+                    No conversions yet. Start converting to build your history!
+                </p>
+            </div>
         """, unsafe_allow_html=True)
-        
-        for item in st.session_state.history[::-1][:10]:
-            st.markdown(f"""
-                <div style='padding: 12px;
-                            margin: 8px 0;
-                            background: rgba(240, 242, 246, 0.5);
-                            border-radius: 8px;
-                            transition: all 0.3s ease;
-                            border: 1px solid rgba(0, 0, 0, 0.05);'>
-                    ➜ {item}
-                </div>
-            """, unsafe_allow_html=True)
-        
-        st.markdown("</div>", unsafe_allow_html=True)
-    
-    # Buttons for history actions
-    col1, col2 = st.columns(2)
-    with col1:
-        st.button("🗑️ Clear History", on_click=clear_history_callback)
-    with col2:
-        if category == "Currency" and st.button("🔄 Refresh Rates"):
-            currency_rates = fetch_currency_rates()
-            st.success("Currency rates updated!")
-else:
-    # No empty space between heading and info message
-    st.markdown("""
-        <div style='background: rgba(240, 248, 255, 0.9); 
-                    padding: 20px; 
-                    border-radius: 10px; 
-                    box-shadow: 0 4px 16px rgba(0, 0, 0, 0.08); 
-                    border: 1px solid rgba(230, 240, 250, 0.8);
-                    margin-top: 10px;
-                    margin-bottom: 10px;'>
-            <p style='text-align: center; color: #1a73e8; font-size: 24px;'>
-                No conversions yet. Start converting to build your history!
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
 
+@st.fragment
+def currency_controls():
+    """Refresh button for the currency rates"""
+    if st.button("🔄 Refresh Rates"):
+        rate_provider.refresh_async()
+        st.success("Refreshing currency rates in the background!")
+
+converter()
@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_stored_at ON responses(stored_at);
+"""
+
+
+def make_cache_key(query, temperature, model_name):
+    """Build a cache key from a parsed query, the temperature bucket and the model"""
+    bucket = "strict" if temperature == 0 else f"creative-{round(temperature, 1)}"
+    return f"{query.value!r}|{query.from_unit}|{query.to_unit}|{bucket}|{model_name}"
+
+
+class ResponseCache:
+    """LRU cache with a TTL for model answers, optionally backed by a SQLite file
+
+    The file can be shared: the bot and the API each keep their own LRU in
+    memory, write every answer as one row, and look up the file on a miss, so
+    an answer stored by one process is found by the other.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._open()
+
+    def get(self, key):
+        """Return the cached answer for a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._conn is not None:
+                # Another process may have stored it since we loaded
+                entry = self._conn.execute(
+                    "SELECT answer, stored_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if entry is not None:
+                    self._remember(key, tuple(entry))
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key, answer):
+        """Store an answer, evicting the least recently used entries if full"""
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, (answer, stored_at))
+            if self._conn is not None:
+                # One row per answer; the file never has to be rewritten
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, answer, stored_at) VALUES (?, ?, ?)",
+                    (key, answer, stored_at),
+                )
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _remember(self, key, entry):
+        """Put an entry in the in-memory LRU, evicting the oldest if full"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _open(self):
+        """Open the backing file, drop expired and surplus rows and load the newest entries"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        # WAL lets the bot and the API read while the other one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        rows = self._conn.execute(
+            "SELECT key, answer, stored_at FROM responses ORDER BY stored_at"
+        ).fetchall()
+        for key, answer, stored_at in rows:
+            self._entries[key] = (answer, stored_at)
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from conversion_api import DEFAULT_MODEL, ConversionService
+from conversion_engine import MODEL_UNAVAILABLE
+from currency_rates import RateProvider
+from response_cache import ResponseCache
+
+# Mismatched units have no local answer, so this always reaches the model
+PROMPT = "convert 5 km to kg"
+
+
+class FakeModel:
+    """Stands in for a Gemini model; each call plays the next behavior in the list"""
+
+    def __init__(self, *behaviors):
+        self.behaviors = list(behaviors)
+        self.timeouts = []
+
+    async def generate_content_async(self, contents, request_options=None):
+        self.timeouts.append(request_options["timeout"])
+        behavior = self.behaviors.pop(0) if self.behaviors else "hang"
+        if behavior == "hang":
+            await asyncio.sleep(60)
+        if isinstance(behavior, Exception):
+            raise behavior
+        return SimpleNamespace(text=behavior)
+
+
+def make_service(model, budget=0.5):
+    service = ConversionService(
+        RateProvider(url="http://127.0.0.1:9/", snapshot_path=None), ResponseCache(), turn_budget=budget
+    )
+    service._models[DEFAULT_MODEL] = model
+    return service
+
+
+def test_model_answers_are_cleaned_and_cached():
+    model = FakeModel("About 5 units.")
+    service = make_service(model)
+    assert asyncio.run(service.strict_answer(PROMPT)) == ("5 units", "model")
+    assert asyncio.run(service.strict_answer(PROMPT)) == ("5 units", "cache")
+    assert 0 < model.timeouts[0] <= 0.5
+
+
+def test_transient_errors_are_retried():
+    service = make_service(FakeModel(TimeoutError(), "7 units"), budget=3)
+    assert asyncio.run(service.strict_answer(PROMPT)) == ("7 units", "model")
+
+
+def test_a_stalled_model_falls_back_within_the_budget():
+    service = make_service(FakeModel("hang"), budget=0.3)
+    loop = asyncio.new_event_loop()
+    try:
+        start = loop.time()
+        assert loop.run_until_complete(service.strict_answer(PROMPT)) == (MODEL_UNAVAILABLE, "fallback")
+        assert loop.time() - start < 1
+    finally:
+        loop.close()
+    # Fallbacks are not cached
+    assert service.response_cache.stats()["size"] == 0
+
+
+def test_other_errors_fall_back():
+    service = make_service(FakeModel(RuntimeError("bad key")))
+    assert asyncio.run(service.strict_answer(PROMPT)) == (MODEL_UNAVAILABLE, "fallback")
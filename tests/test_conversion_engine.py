@@ -0,0 +1,36 @@
+import time
+
+from conversion_engine import COMPOUND_PATTERN, MAX_QUERY_LENGTH, QUERY_PATTERN, parse_conversion, split_queries
+
+
+def elapsed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def test_long_digit_runs_are_scanned_in_linear_time():
+    # Used to take 0.7 s at 4000 digits and grow with the square of the length
+    text = "convert " + "1" * 20000 + "x"
+    assert elapsed(lambda: list(COMPOUND_PATTERN.finditer(text))) < 0.5
+    assert elapsed(lambda: list(QUERY_PATTERN.finditer(text))) < 0.5
+
+
+def test_prompts_just_under_the_length_cap_parse_quickly():
+    text = "convert " + "1" * (MAX_QUERY_LENGTH - 10) + "x"
+    assert elapsed(parse_conversion, text) < 0.1
+    assert elapsed(split_queries, text) < 0.1
+
+
+def test_prompts_over_the_length_cap_are_not_parsed():
+    text = "convert 5 km to miles " + " " * MAX_QUERY_LENGTH
+    assert parse_conversion(text) is None
+    assert split_queries(text) == [text]
+
+
+def test_unit_expressions_still_parse():
+    query = parse_conversion("convert 8 L/100km to mpg")
+    assert (query.value, query.from_unit, query.to_unit, query.category) == (8.0, "L/100km", "mpg", "Compound")
+    query = parse_conversion("what is 2 kg per m³ in lb/ft³")
+    assert (query.from_unit, query.to_unit) == ("kg per m³", "lb/ft³")
+    assert split_queries("convert 5 km to miles and 3 kWh to MJ") == ["convert 5 km to miles", "convert 3 kWh to MJ"]
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from currency_rates import RateProvider
+
+OLD_RATES = {"USD": 1.0, "EUR": 0.9, "GBP": 0.8}
+NEW_RATES = {"USD": 1.0, "EUR": 0.95, "GBP": 0.75, "JPY": 150.0}
+
+
+class RatesServer:
+    """A local stand-in for the rates API; hold() makes requests wait until release()"""
+
+    def __init__(self):
+        self.rates = NEW_RATES
+        self.status = 200
+        self.requests = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                server.gate.wait(5)
+                body = json.dumps({"base": "USD", "rates": server.rates}).encode()
+                self.send_response(server.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/latest/USD"
+
+    def hold(self):
+        self.gate.clear()
+
+    def release(self):
+        self.gate.set()
+
+
+@pytest.fixture
+def rates_server():
+    server = RatesServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release()
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def write_snapshot(path, rates, fetched_at):
+    with open(path, "w") as f:
+        json.dump({"fetched_at": fetched_at, "rates": rates}, f)
+
+
+def test_refresh_saves_a_snapshot_the_next_provider_starts_from(rates_server, tmp_path):
+    snapshot = str(tmp_path / "currency_rates.json")
+    provider = RateProvider(url=rates_server.url, snapshot_path=snapshot)
+    assert provider.get_rates() == {}
+
+    assert provider.refresh()
+    assert provider.rates == NEW_RATES
+    assert provider.table.rate("EUR", "GBP") == pytest.approx(0.75 / 0.95)
+
+    # A cold start serves the saved rates without asking the server again
+    rates_server.requests = 0
+    reloaded = RateProvider(url=rates_server.url, snapshot_path=snapshot)
+    assert reloaded.get_rates() == NEW_RATES
+    assert reloaded.fetched_at == provider.fetched_at
+    assert not reloaded.is_refreshing()
+    assert rates_server.requests == 0
+
+
+def test_stale_rates_are_served_while_a_refresh_runs(rates_server, tmp_path):
+    snapshot = str(tmp_path / "currency_rates.json")
+    write_snapshot(snapshot, OLD_RATES, time.time() - 3600)
+    provider = RateProvider(url=rates_server.url, snapshot_path=snapshot, max_age=600)
+    assert provider.is_stale()
+
+    rates_server.hold()
+    assert provider.get_rates() == OLD_RATES
+    assert provider.is_refreshing()
+    # Readers keep getting the old rates until the response lands
+    assert provider.get_rates() == OLD_RATES
+    assert provider.table.rate("USD", "EUR") == pytest.approx(0.9)
+
+    rates_server.release()
+    provider.wait(timeout=5)
+    assert not provider.is_refreshing()
+    assert not provider.is_stale()
+    assert provider.get_rates() == NEW_RATES
+    assert rates_server.requests == 1
+    with open(snapshot) as f:
+        assert json.load(f)["rates"] == NEW_RATES
+
+
+def test_failed_refresh_keeps_the_last_good_rates(rates_server, tmp_path):
+    snapshot = str(tmp_path / "currency_rates.json")
+    write_snapshot(snapshot, OLD_RATES, time.time() - 3600)
+    provider = RateProvider(url=rates_server.url, snapshot_path=snapshot, max_age=600)
+
+    rates_server.status = 503
+    assert not provider.refresh()
+    assert provider.last_error
+    assert provider.get_rates() == OLD_RATES
+    # No new attempt until the retry delay has passed
+    assert not provider.is_refreshing()
+    assert rates_server.requests == 1
+    with open(snapshot) as f:
+        assert json.load(f)["rates"] == OLD_RATES
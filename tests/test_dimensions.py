@@ -0,0 +1,68 @@
+import pytest
+
+from conversion_engine import parse_conversion
+from dimensions import DimensionError, UnitExpressionError, apply_plan, compile_plan, parse_unit
+
+
+def convert(value, from_text, to_text):
+    return apply_plan(compile_plan(from_text, to_text), value)
+
+
+def test_energy_units_with_prefixes():
+    assert convert(1, "kWh", "MJ") == pytest.approx(3.6)
+    assert convert(3.6, "MJ", "kWh") == pytest.approx(1)
+    assert convert(1, "kilowatt hour", "kJ") == pytest.approx(3600)
+
+
+def test_fuel_consumption_converts_both_ways_as_a_reciprocal():
+    plan = compile_plan("L/100km", "mpg")
+    assert plan.reciprocal
+    assert convert(8, "L/100km", "mpg") == pytest.approx(29.4018, rel=1e-4)
+    assert convert(29.4018, "mpg", "L/100km") == pytest.approx(8, rel=1e-4)
+    assert convert(0, "mpg", "L/100km") == float("inf")
+
+
+def test_temperature_offsets_are_dropped_in_compound_units():
+    # A plain temperature keeps its offset, a temperature inside a compound is a difference
+    assert compile_plan("°C", "K").offset == pytest.approx(273.15)
+    assert convert(10, "°C/s", "K/s") == pytest.approx(10)
+    assert convert(4.184, "J/(g·°C)", "J/(g·K)") == pytest.approx(4.184)
+    assert convert(1, "cal/(g·°C)", "J/(kg·K)") == pytest.approx(4184)
+
+
+def test_mismatched_dimensions_raise_dimension_error():
+    with pytest.raises(DimensionError):
+        compile_plan("kWh", "kg")
+    # Inverse dimensions only convert when neither side has an offset
+    with pytest.raises(DimensionError):
+        compile_plan("°C", "1/K")
+
+
+@pytest.mark.parametrize("text", [
+    "km^99999",
+    "m^-999",
+    "square m^7",
+    "m/0",
+    "0 m",
+    "1e400 m",
+    "Ym^12·Ym^12",
+    "(" * 5000 + "m" + ")" * 5000,
+    "(m",
+    "m)",
+    "furlongs",
+    "",
+])
+def test_malformed_expressions_raise_unit_expression_error(text):
+    with pytest.raises(UnitExpressionError):
+        parse_unit(text)
+
+
+def test_scales_out_of_range_raise_unit_expression_error():
+    with pytest.raises(UnitExpressionError):
+        compile_plan("1e300 m", "1e-300 m")
+
+
+def test_malformed_expressions_are_not_conversion_questions():
+    assert parse_conversion("convert 1 km^99999 to m") is None
+    assert parse_conversion("convert 1 " + "(" * 400 + "m" + ")" * 400 + " to m") is None
+    assert parse_conversion("convert 5 m/0 to m") is None
@@ -0,0 +1,164 @@
+import numpy as np
+
+# Every unit both apps know about, grouped by category:
+# (unit, label, factor to the first unit of the category, extra aliases)
+# Temperature factors are (scale, offset) pairs because the conversion is affine.
+# Speed factors are (distance unit, time unit) pairs, derived from those categories.
+UNITS = {
+    "Distance": [
+        ("meter", "Meters", 1.0, ["m", "metre", "metres"]),
+        ("kilometer", "Kilometers", 1000.0, ["km", "kms", "kilometre", "kilometres"]),
+        ("centimeter", "Centimeters", 0.01, ["cm", "centimetre", "centimetres"]),
+        ("millimeter", "Millimeters", 0.001, ["mm", "millimetre", "millimetres"]),
+        ("mile", "Miles", 1609.344, ["mi"]),
+        ("yard", "Yards", 0.9144, ["yd", "yds"]),
+        ("foot", "Feet", 0.3048, ["ft"]),
+        ("inch", "Inches", 0.0254, ["in"]),
+        ("nautical mile", "Nautical Miles", 1852.0, ["nmi"]),
+    ],
+    "Temperature": [
+        ("celsius", "Celsius", (1.0, 0.0), ["°c", "c", "degc"]),
+        ("fahrenheit", "Fahrenheit", (5 / 9, -32 * 5 / 9), ["°f", "f", "degf"]),
+        ("kelvin", "Kelvin", (1.0, -273.15), ["k", "kelvins"]),
+    ],
+    "Weight": [
+        ("kilogram", "Kilograms", 1.0, ["kg", "kgs", "kilo", "kilos"]),
+        ("gram", "Grams", 0.001, ["g"]),
+        ("milligram", "Milligrams", 0.000001, ["mg"]),
+        ("pound", "Pounds", 0.45359237, ["lb", "lbs"]),
+        ("ounce", "Ounces", 0.028349523125, ["oz"]),
+        ("stone", "Stones", 6.35029318, ["st"]),
+        ("tonne", "Tonnes", 1000.0, ["t"]),
+        ("ton", "Tons", 907.18474, []),
+    ],
+    "Pressure": [
+        ("pascal", "Pascals", 1.0, ["pa"]),
+        ("hectopascal", "Hectopascals", 100.0, ["hpa"]),
+        ("kilopascal", "Kilopascals", 1000.0, ["kpa"]),
+        ("bar", "Bar", 100000.0, ["bars"]),
+        ("atmosphere", "Atmospheres", 101325.0, ["atm"]),
+        ("psi", "PSI", 6894.757293168, []),
+    ],
+    "Time": [
+        ("second", "Seconds", 1.0, ["s", "sec", "secs"]),
+        ("minute", "Minutes", 60.0, ["min", "mins"]),
+        ("hour", "Hours", 3600.0, ["h", "hr", "hrs"]),
+        ("day", "Days", 86400.0, []),
+        ("week", "Weeks", 604800.0, ["wk"]),
+        ("month", "Months", 2628000.0, []),
+        ("year", "Years", 31536000.0, ["yr", "yrs"]),
+    ],
+    "Volume": [
+        ("liter", "Liters", 1.0, ["l", "litre", "litres"]),
+        ("milliliter", "Milliliters", 0.001, ["ml", "millilitre", "millilitres"]),
+        ("gallon", "Gallons", 3.785411784, ["gal"]),
+        ("quart", "Quarts", 0.946352946, ["qt"]),
+        ("pint", "Pints", 0.473176473, ["pt"]),
+        ("cup", "Cups", 0.2365882365, []),
+        ("cubic meter", "Cubic Meters", 1000.0, ["m3"]),
+    ],
+    "Area": [
+        ("square meter", "Square Meters", 1.0, ["m2", "sqm"]),
+        ("square kilometer", "Square Kilometers", 1e6, ["km2", "sqkm"]),
+        ("acre", "Acres", 4046.8564224, ["ac"]),
+        ("hectare", "Hectares", 10000.0, ["ha"]),
+    ],
+    "Speed": [
+        ("meter per second", "Meters per second", ("meter", "second"), ["mps", "m/s"]),
+        ("kilometer per hour", "Kilometers per hour", ("kilometer", "hour"), ["kph", "kmh", "km/h"]),
+        ("mile per hour", "Miles per hour", ("mile", "hour"), ["mph", "mi/h"]),
+        ("foot per second", "Feet per second", ("foot", "second"), ["ft/s"]),
+        ("knot", "Knots", ("nautical mile", "hour"), ["kn", "kt"]),
+    ],
+    "Data": [
+        ("byte", "Bytes", 1.0, ["b"]),
+        ("kilobyte", "Kilobytes", 1024.0, ["kb"]),
+        ("megabyte", "Megabytes", 1024.0 ** 2, ["mb"]),
+        ("gigabyte", "Gigabytes", 1024.0 ** 3, ["gb"]),
+        ("terabyte", "Terabytes", 1024.0 ** 4, ["tb"]),
+    ],
+}
+
+CATEGORIES = list(UNITS)
+
+# Short forms used when writing a result back to the user
+UNIT_SYMBOLS = {
+    "celsius": "°C",
+    "fahrenheit": "°F",
+    "kelvin": "K",
+}
+
+UNIT_INDEX = {}      # unit -> (category, row in the category matrices)
+UNIT_FACTORS = {}    # unit -> (scale, offset) to the first unit of its category
+UNIT_LABELS = {}     # unit -> display label, e.g. "Meters"
+LABEL_INDEX = {}     # display label -> unit
+ALIAS_INDEX = {}     # any accepted spelling -> unit
+SCALE_MATRICES = {}  # category -> N x N array of multipliers
+OFFSET_MATRICES = {} # category -> N x N array of offsets (non-zero only for temperature)
+
+
+def _add_alias(alias, unit):
+    """Register one spelling of a unit, refusing ambiguous aliases"""
+    alias = alias.lower()
+    if ALIAS_INDEX.get(alias, unit) != unit:
+        raise ValueError(f"Alias '{alias}' is used by both {ALIAS_INDEX[alias]} and {unit}")
+    ALIAS_INDEX[alias] = unit
+
+
+def _build():
+    """Fill the lookup tables and precompute the conversion matrices"""
+    for category, entries in UNITS.items():
+        scales = np.empty(len(entries))
+        offsets = np.zeros(len(entries))
+        for row, (unit, label, factor, aliases) in enumerate(entries):
+            if isinstance(factor, tuple) and isinstance(factor[0], str):
+                # A derived unit: distance per time, from factors already built
+                factor = UNIT_FACTORS[factor[0]][0] / UNIT_FACTORS[factor[1]][0]
+            scales[row], offsets[row] = factor if isinstance(factor, tuple) else (factor, 0.0)
+            UNIT_FACTORS[unit] = (float(scales[row]), float(offsets[row]))
+            UNIT_INDEX[unit] = (category, row)
+            UNIT_LABELS[unit] = label
+            LABEL_INDEX[label] = unit
+            for alias in [unit, unit + "s", label, *aliases]:
+                _add_alias(alias, unit)
+        # x_base = scale_i * x + offset_i, so x_j = x * scale_i / scale_j + (offset_i - offset_j) / scale_j
+        SCALE_MATRICES[category] = scales[:, None] / scales[None, :]
+        OFFSET_MATRICES[category] = (offsets[:, None] - offsets[None, :]) / scales[None, :]
+
+
+_build()
+
+
+def resolve_unit(name):
+    """Return the unit for a name, label or abbreviation, or None"""
+    return ALIAS_INDEX.get(name.strip().lower())
+
+
+def category_of(unit):
+    """Return the category of a unit, or None if it is unknown"""
+    entry = UNIT_INDEX.get(unit)
+    return entry[0] if entry else None
+
+
+def unit_labels(category):
+    """Return the display labels of a category's units in registry order"""
+    return [label for _, label, _, _ in UNITS[category]]
+
+
+def conversion_factor(from_unit, to_unit):
+    """Return (scale, offset) so that result = value * scale + offset, or None"""
+    from_entry, to_entry = UNIT_INDEX.get(from_unit), UNIT_INDEX.get(to_unit)
+    if from_entry is None or to_entry is None or from_entry[0] != to_entry[0]:
+        return None
+    category, row = from_entry
+    column = to_entry[1]
+    return float(SCALE_MATRICES[category][row, column]), float(OFFSET_MATRICES[category][row, column])
+
+
+def convert(value, from_unit, to_unit):
+    """Convert a number or NumPy array between two units of one category, or return None"""
+    factor = conversion_factor(from_unit, to_unit)
+    if factor is None:
+        return None
+    scale, offset = factor
+    return value * scale + offset
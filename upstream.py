@@ -0,0 +1,140 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+# Seconds one turn may spend waiting on Gemini, retries and hedges included
+TURN_BUDGET = float(os.getenv("TURN_LATENCY_BUDGET", "8"))
+MAX_ATTEMPTS = 3
+BACKOFF_INITIAL = 0.25
+BACKOFF_MAX = 2.0
+# Up to this many seconds of random delay on each backoff so retries don't line up
+BACKOFF_JITTER = BACKOFF_INITIAL
+# Start a hedged request once the primary is slower than this share of its recent calls
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+# Hedge delay used until enough calls have been seen to compute the percentile
+HEDGE_DEFAULT_DELAY = 2.0
+LATENCY_WINDOW = 200
+# Errors worth another attempt: timeouts, rate limits and server-side failures
+TRANSIENT_ERRORS = {
+    "DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "TooManyRequests",
+    "ResourceExhausted", "GatewayTimeout", "BadGateway", "Aborted", "RetryError",
+}
+
+# Threads the hedged calls run on; a call that misses the deadline is left to finish here
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="upstream")
+
+
+class Deadline:
+    """A latency budget shared by every upstream call in one turn"""
+
+    def __init__(self, seconds=TURN_BUDGET):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class LatencyTracker:
+    """Recent call latencies per model, used to decide when a request is slow enough to hedge"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            self._latencies.setdefault(model_name, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model_name, percentile=HEDGE_PERCENTILE):
+        """Return how long to wait for model_name before also asking another model"""
+        with self._lock:
+            latencies = list(self._latencies.get(model_name, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return float(np.percentile(latencies, percentile))
+
+
+def is_transient(error):
+    """Check whether a failed call is worth retrying"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def _stop_at(deadline, attempts):
+    """Stop retrying after attempts tries or when the next backoff would pass the deadline"""
+    by_attempts = stop_after_attempt(attempts)
+    return lambda state: by_attempts(state) or state.upcoming_sleep >= deadline.remaining()
+
+
+def _retrying(cls, deadline, attempts):
+    return cls(
+        stop=_stop_at(deadline, attempts),
+        wait=wait_exponential_jitter(initial=BACKOFF_INITIAL, max=BACKOFF_MAX, jitter=BACKOFF_JITTER),
+        retry=retry_if_exception(is_transient),
+        reraise=True,
+    )
+
+
+def call_with_retries(func, deadline, attempts=MAX_ATTEMPTS):
+    """Call func(timeout) with the time left, retrying transient errors with exponential backoff"""
+    for attempt in _retrying(Retrying, deadline, attempts):
+        with attempt:
+            if deadline.expired():
+                raise TimeoutError("turn latency budget used up")
+            return func(deadline.remaining())
+
+
+async def call_with_retries_async(func, deadline, attempts=MAX_ATTEMPTS):
+    """Async version of call_with_retries; func(timeout) returns a coroutine"""
+    async for attempt in _retrying(AsyncRetrying, deadline, attempts):
+        with attempt:
+            if deadline.expired():
+                raise TimeoutError("turn latency budget used up")
+            return await func(deadline.remaining())
+
+
+def _submit(func):
+    """Run func on the executor in a copy of the current context"""
+    return _executor.submit(contextvars.copy_context().run, func)
+
+
+def hedged(primary, secondary, delay, deadline):
+    """Run primary(); if it hasn't answered after delay seconds, also run secondary()
+
+    Returns the first successful result. Gives up with TimeoutError at the deadline
+    (the calls are left to finish in the background) and re-raises the last error
+    when every call failed. Pass secondary=None to only enforce the deadline.
+    Both calls run in a copy of the caller's context, so metrics land in its turn.
+    """
+    pending = {_submit(primary)}
+    hedge_at = time.monotonic() + delay if secondary else None
+    error = None
+    while pending:
+        timeout = deadline.remaining()
+        if hedge_at is not None:
+            timeout = min(timeout, max(0.0, hedge_at - time.monotonic()))
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        if hedge_at is not None and (time.monotonic() >= hedge_at or not pending):
+            # The primary is slow (or already failed): ask the secondary model as well
+            pending.add(_submit(secondary))
+            hedge_at = None
+        elif not done and deadline.expired():
+            raise TimeoutError("turn latency budget used up")
+    raise error
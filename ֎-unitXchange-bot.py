@@ -1,10 +1,21 @@
 import os
-import json
 import streamlit as st
 from dotenv import load_dotenv
-import google.generativeai as gen_ai
 from datetime import datetime
+from functools import partial
 import re
+import time
+from conversion_engine import (
+    MODEL_UNAVAILABLE, answer_query, build_strict_prompt, clean_strict_answer, describe_conversion, parse_conversion,
+    split_queries,
+)
+from response_cache import ResponseCache, make_cache_key
+from chat_store import ChatStore
+from chat_index import ChatIndex, search_expression
+from context_window import build_history, plan_fold, summarize_turns
+from fan_out import AsyncRunner, SingleFlight, gather_limited
+from metrics import get_metrics
+from upstream import Deadline, LatencyTracker, call_with_retries, call_with_retries_async, hedged
 
 # Load environment variables
 load_dotenv()
@@ -17,12 +28,77 @@ st.set_page_config(
 )
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-# Set up Google Gemini AI model
-gen_ai.configure(api_key=GOOGLE_API_KEY)
-model = gen_ai.GenerativeModel('gemini-2.0-flash')
+# The Gemini SDK takes most of a second to import, so it is only loaded
+# when the first message needs the model, not before the page is drawn
+@st.cache_resource
+def get_genai():
+    """Import and configure the Gemini SDK once per process"""
+    import google.generativeai as gen_ai
+    gen_ai.configure(api_key=GOOGLE_API_KEY)
+    return gen_ai
+
+@st.cache_resource
+def get_model(model_name, temperature):
+    """Build one Gemini model per name and temperature and reuse it across reruns"""
+    return get_genai().GenerativeModel(model_name, generation_config={"temperature": temperature})
 
 # Add this constant for the chat history file
 CHAT_HISTORY_FILE = "chat_histories.json"
+CHAT_DB_FILE = "chat_histories.db"
+RESPONSE_CACHE_FILE = "response_cache.db"
+# Context sent to Gemini: the newest messages within this budget, older ones summarized
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "12"))
+# Chats not opened for this many days move to compressed archives (0 keeps all chats hot)
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# How often a long-running server looks for chats to archive
+ARCHIVE_CHECK_SECONDS = 86400
+# Chats listed per sidebar page
+CHATS_PER_PAGE = 10
+
+@st.cache_resource
+def get_chat_store():
+    """Open the chat database once per process, importing the old JSON file on first run"""
+    store = ChatStore(CHAT_DB_FILE)
+    store.migrate_from_json(CHAT_HISTORY_FILE)
+    if ARCHIVE_AFTER_DAYS > 0:
+        # Archiving runs in the background so it never delays the first page
+        store.archive_periodically(ARCHIVE_AFTER_DAYS * 86400, ARCHIVE_CHECK_SECONDS)
+    return store
+
+chat_store = get_chat_store()
+
+@st.cache_resource
+def get_response_cache():
+    """Share one cache of model answers across all sessions"""
+    return ResponseCache(path=RESPONSE_CACHE_FILE)
+
+response_cache = get_response_cache()
+# Span timings and counters for every turn, written to metrics.jsonl
+metrics = get_metrics()
+
+@st.cache_resource
+def get_async_runner():
+    """Share one background event loop for concurrent Gemini calls"""
+    return AsyncRunner()
+
+@st.cache_resource
+def get_single_flight():
+    """Share in-flight Gemini calls and the upstream call limit across all sessions"""
+    return SingleFlight()
+
+single_flight = get_single_flight()
+
+# When a model is slow, the same stateless request is also sent to the other one
+HEDGE_MODELS = {"gemini-2.0-flash": "gemini-1.5-flash", "gemini-1.5-flash": "gemini-2.0-flash"}
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "1") == "1"
+
+@st.cache_resource
+def get_latency_tracker():
+    """Share recent Gemini latencies across sessions to pick the hedging delay"""
+    return LatencyTracker()
+
+latency_tracker = get_latency_tracker()
 
 def get_chat_title(prompt):
     """Generate a short title from the first question"""
@@ -36,128 +112,248 @@ def get_chat_title(prompt):
     return title if title else "New Chat"
 
 def is_conversion_question(text):
-    """Check if the question is about unit conversion with strict validation"""
-    # Define valid units and their variations
-    valid_units = {
-        'length': ['kilometer', 'kilometre', 'meter', 'metre', 'centimeter', 'centimetre', 
-                  'millimeter', 'millimetre', 'mile', 'yard', 'foot', 'feet', 'inch', 'km', 
-                  'm', 'cm', 'mm', 'mi', 'yd', 'ft', 'in'],
-        'weight': ['kilogram', 'kilo', 'gram', 'milligram', 'pound', 'ounce', 'kg', 'g', 'mg', 
-                  'lb', 'oz', 'ton', 'tonne'],
-        'temperature': ['celsius', 'fahrenheit', 'kelvin', '°c', '°f', 'k'],
-        'volume': ['liter', 'litre', 'milliliter', 'millilitre', 'gallon', 'quart', 
-                  'pint', 'cup', 'l', 'ml', 'gal', 'qt', 'pt'],
-        'time': ['second', 'minute', 'hour', 'day', 'week', 'month', 'year',
-                'sec', 'min', 'hr', 'yr']
-    }
-    
-    # Flatten the units list
-    all_units = [unit for category in valid_units.values() for unit in category]
-    
-    # Convert text to lowercase and remove extra spaces
-    text = ' '.join(text.lower().split())
-    
-    # Add spaces after numbers if missing
-    text = re.sub(r'(\d)([a-zA-Z])', r'\1 \2', text)
-    
-    # Check for strict conversion patterns with more variations
-    conversion_patterns = [
-        # Standard patterns with spaces
-        r'convert\s+(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)\s+(?:to|into|in)\s+([a-zA-Z°]+)',
-        r'how\s+many\s+([a-zA-Z°]+)\s+(?:are|is)\s+(?:in|there\s+in)\s+(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)',
-        r'what\s+is\s+(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)\s+(?:to|in|into)\s+([a-zA-Z°]+)',
-        r'change\s+(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)\s+(?:to|into|in)\s+([a-zA-Z°]+)',
-        
-        # Patterns without spaces between number and unit
-        r'convert\s+(\d+(?:\.\d+)?)([a-zA-Z°]+)\s+(?:to|into|in)\s+([a-zA-Z°]+)',
-        r'how\s+many\s+([a-zA-Z°]+)\s+(?:are|is)\s+(?:in|there\s+in)\s+(\d+(?:\.\d+)?)([a-zA-Z°]+)',
-        r'what\s+is\s+(\d+(?:\.\d+)?)([a-zA-Z°]+)\s+(?:to|in|into)\s+([a-zA-Z°]+)',
-        r'change\s+(\d+(?:\.\d+)?)([a-zA-Z°]+)\s+(?:to|into|in)\s+([a-zA-Z°]+)'
-    ]
-    
-    for pattern in conversion_patterns:
-        match = re.search(pattern, text)
-        if match:
-            groups = match.groups()
-            # Extract units (removing any numbers) and check if they're valid
-            units = []
-            for group in groups:
-                if group:
-                    # Remove numbers and clean the unit
-                    clean_unit = re.sub(r'[\d\s.]', '', group.lower())
-                    if any(valid_unit in clean_unit for valid_unit in all_units):
-                        units.append(clean_unit)
-            
-            if len(units) >= 2:  # Must have at least two different units
-                return True
-    
-    return False
+    """Parse a unit conversion question, returning a ConversionQuery or None"""
+    with metrics.span("parse"):
+        return parse_conversion(text)
+
+def lookup_cached(cache_key):
+    """Return a cached model answer or None, counting hits and misses"""
+    with metrics.span("cache_lookup"):
+        cached_response = response_cache.get(cache_key)
+    metrics.incr("cache_hits" if cached_response is not None else "cache_misses")
+    return cached_response
+
+def build_context(chat_id, live_chat):
+    """Return the chat history to send: a cached summary plus the most recent turns"""
+    messages = live_chat["messages"]
+    fold_to = plan_fold(messages, live_chat["summary_upto"], CONTEXT_MAX_MESSAGES, CONTEXT_TOKEN_BUDGET)
+    if fold_to > live_chat["summary_upto"]:
+        older = messages[live_chat["summary_upto"]:fold_to]
+        live_chat["summary"] = summarize_turns(live_chat["summary"], older)
+        live_chat["summary_upto"] = fold_to
+        chat_store.save_summary(chat_id, live_chat["summary"], fold_to)
+    return build_history(live_chat["summary"], messages[fold_to:])
+
+def send_to_model(message, deadline, stream=False):
+    """Send a message to Gemini with a token-budgeted context of the current chat"""
+    chat_id = st.session_state.current_chat_id
+    live_chat = st.session_state.chat_sessions[chat_id]
+    if live_chat["session"] is None:
+        live_chat["session"] = get_model(*live_chat["settings"]).start_chat()
+    live_chat["session"].history = build_context(chat_id, live_chat)
+
+    def attempt(timeout):
+        metrics.incr("llm_calls")
+        with single_flight.slot():
+            return live_chat["session"].send_message(
+                message, stream=stream, request_options={"timeout": timeout}
+            )
+
+    if stream:
+        # Streamed calls are timed by the caller while the chunks arrive
+        # and only hold an upstream slot while the request is being sent
+        return call_with_retries(attempt, deadline)
+    with metrics.span("llm_call"):
+        return call_with_retries(attempt, deadline)
+
+def generate_stateless(model_name, temperature, contents, deadline):
+    """Call Gemini without chat history, retrying and hedging to the other model when slow"""
+    def call(name, model):
+        def attempt(timeout):
+            metrics.incr("llm_calls")
+            start = time.perf_counter()
+            response = model.generate_content(contents, request_options={"timeout": timeout})
+            latency_tracker.record(name, time.perf_counter() - start)
+            return response
+
+        return call_with_retries(attempt, deadline)
+
+    # Models are looked up here because the calls run on worker threads
+    secondary = HEDGE_MODELS.get(model_name) if HEDGE_REQUESTS else None
+    return hedged(
+        partial(call, model_name, get_model(model_name, temperature)),
+        partial(call, secondary, get_model(secondary, temperature)) if secondary else None,
+        latency_tracker.hedge_delay(model_name),
+        deadline,
+    )
+
+def fallback_answer(query, temperature):
+    """Answer from the local conversion table when Gemini can't, or apologize"""
+    metrics.incr("fallbacks")
+    local_answer = answer_query(query) if query else None
+    if not local_answer:
+        return MODEL_UNAVAILABLE
+    if temperature > 0:
+        formula, _ = describe_conversion(query.from_unit, query.to_unit)
+        local_answer += f" ({formula})"
+    return local_answer
+
+def build_creative_request(prompt, query):
+    """Pick the formula prefix and the message to send for a creative answer"""
+    if query and query.category:
+        formula, explanation = describe_conversion(query.from_unit, query.to_unit)
+        prefix = (
+            f"🔢 **Formula:**\n{formula}\n\n"
+            f"📝 **How to Convert:**\n{explanation}\n\n"
+            f"🎯 **Your Result:**\n"
+         )
+        return prefix, prompt
+
+    # If no specific formula found, give a creative response
+    return (
+        "🔄 Let me help you with that conversion!\n\n",
+        prompt + "\nProvide a detailed explanation with the conversion."
+    )
+
+def ask_strict(prompt, query, model_name, cache_key, deadline):
+    """Get a strict-mode answer, sharing one Gemini call among sessions asking the same thing"""
+    def call():
+        # Strict answers don't depend on the chat, so they go out without history
+        with metrics.span("llm_call"):
+            response = generate_stateless(model_name, 0, build_strict_prompt(prompt), deadline)
+        answer = clean_strict_answer(response.text)
+        response_cache.put(cache_key, answer)
+        return answer
+
+    try:
+        answer, shared = single_flight.do(("answer", cache_key), call, timeout=deadline.remaining())
+    except Exception:
+        return fallback_answer(query, 0)
+    if shared:
+        metrics.incr("coalesced")
+    return answer
+
+def ask_model(prompt, query, cache_key, deadline):
+    """Send a creative conversion question to Gemini with the chat as context"""
+    # Creative mode: Detailed responses with formulas and explanations
+    prefix, message = build_creative_request(prompt, query)
+    try:
+        response = prefix + send_to_model(message, deadline).text
+    except Exception:
+        return fallback_answer(query, 1)
+    if cache_key:
+        response_cache.put(cache_key, response)
+    return response
+
+def stream_model(prompt, query, cache_key, deadline):
+    """Yield a creative-mode answer in chunks as Gemini produces them, caching it once complete"""
+    prefix, message = build_creative_request(prompt, query)
+    yield prefix
+    parts = [prefix]
+    try:
+        with metrics.span("llm_call"):
+            for chunk in send_to_model(message, deadline, stream=True):
+                if chunk.parts:
+                    parts.append(chunk.text)
+                    yield chunk.text
+    except Exception:
+        # A stream that fails part-way is finished from the local table and not cached
+        yield "\n\n" + fallback_answer(query, 1)
+        return
+    if cache_key:
+        response_cache.put(cache_key, "".join(parts))
+
+def answer_many(questions, temperature, model_name, deadline):
+    """Answer several conversions at once, sending the ones we can't resolve to Gemini concurrently"""
+    answers = [None] * len(questions)
+    pending = []
+    for position, question in enumerate(questions):
+        query = is_conversion_question(question)
+        local_answer = answer_query(query) if query else None
+        if local_answer:
+            if temperature > 0:
+                formula, _ = describe_conversion(query.from_unit, query.to_unit)
+                local_answer += f" ({formula})"
+            answers[position] = local_answer
+            metrics.incr("local_answers")
+            continue
+
+        cache_key = make_cache_key(query, temperature, model_name) if query else None
+        cached_response = lookup_cached(cache_key) if cache_key else None
+        if cached_response is not None:
+            answers[position] = cached_response
+            continue
+
+        if temperature == 0:
+            prefix, message = "", build_strict_prompt(question)
+        else:
+            prefix, message = build_creative_request(question, query)
+        pending.append((position, query, prefix, message, cache_key))
+
+    if pending:
+        # Sub-questions don't need the chat history, so they go out as independent requests
+        model = get_model(model_name, temperature)
 
-def generate_conversion_response(prompt, temperature):
+        def attempt(message, timeout):
+            return model.generate_content_async(message, request_options={"timeout": timeout})
+
+        def call(message, cache_key):
+            # The same sub-question asked in another session shares this request
+            key = ("response", cache_key) if cache_key else None
+            return single_flight.do_async(
+                key, lambda: call_with_retries_async(partial(attempt, message), deadline)
+            )
+
+        calls = [partial(call, message, cache_key) for _, _, _, message, cache_key in pending]
+        with metrics.span("llm_call"):
+            try:
+                responses = get_async_runner().run(gather_limited(calls), timeout=deadline.remaining())
+            except TimeoutError as e:
+                responses = [e] * len(pending)
+        for (position, query, prefix, _, cache_key), response in zip(pending, responses):
+            if isinstance(response, Exception):
+                answers[position] = fallback_answer(query, temperature)
+                continue
+            response, shared = response
+            metrics.incr("coalesced" if shared else "llm_calls")
+            if temperature == 0:
+                answers[position] = clean_strict_answer(response.text)
+            else:
+                answers[position] = prefix + response.text
+            if cache_key and not shared:
+                response_cache.put(cache_key, answers[position])
+
+    return "\n\n".join(f"**{question}**\n{answer}" for question, answer in zip(questions, answers))
+
+def generate_conversion_response(prompt, temperature, model_name, stream=False):
     """Generate a response for conversion questions based on temperature"""
+    query = is_conversion_question(prompt)
     if temperature == 0:
         # Strict mode: Only exact conversion questions with minimal response
-        if not is_conversion_question(prompt):
+        if not query:
             return "Invalid format. Use:\n'Convert X units to units'"
-        else:
-            # Create a strict prompt for the model
-            strict_prompt = (
-                "Respond with ONLY the number and unit. "
-                "No explanations, no additional text. "
-                "Example format: '1000 grams' or '100 meters'. "
-                "Question: " + prompt
-            )
-            response = st.session_state.chat_session.send_message(strict_prompt).text
-            
-            # Clean the response to ensure it's just numbers and units
-            cleaned_response = re.sub(r'[^0-9\s.a-zA-Z°]', '', response)
-            # Extract just the first number and unit
-            match = re.search(r'(\d+(?:\.\d+)?)\s*([a-zA-Z°]+)', cleaned_response)
-            if match:
-                return f"{match.group(1)} {match.group(2)}"
-            return cleaned_response.strip()
-    else:
-        # Creative mode: Detailed responses with formulas and explanations
-        if any(keyword in prompt.lower() for keyword in ['convert', 'how many', 'what is']):
-            conversion_formulas = {
-                ('kilo', 'gram'): {
-                    'formula': '1 kilogram = 1000 grams',
-                    'explanation': 'Multiply kilograms by 1000 to get grams'
-                },
-                ('meter', 'centimeter'): {
-                    'formula': '1 meter = 100 centimeters',
-                    'explanation': 'Multiply meters by 100 to get centimeters'
-                },
-                ('celsius', 'fahrenheit'): {
-                    'formula': '°F = (°C × 9/5) + 32',
-                    'explanation': 'First multiply by 9/5, then add 32'
-                },
-                ('mile', 'kilometer'): {
-                    'formula': '1 mile ≈ 1.60934 kilometers',
-                    'explanation': 'Multiply miles by 1.60934 to get kilometers'
-                }
-            }
-
-            text = prompt.lower()
-            for (unit1, unit2), info in conversion_formulas.items():
-                if unit1 in text and unit2 in text:
-                    response = (
-                        f"🔢 **Formula:**\n{info['formula']}\n\n"
-                        f"📝 **How to Convert:**\n{info['explanation']}\n\n"
-                        f"🎯 **Your Result:**\n"
-                     )
-                    result = st.session_state.chat_session.send_message(prompt).text
-                    return response + result
-
-            # If no specific formula found, give a creative response
-            return (
-                "🔄 Let me help you with that conversion!\n\n" +
-                st.session_state.chat_session.send_message(
-                    prompt + "\nProvide a detailed explanation with the conversion."
-                ).text
-            )
-        else:
-            return "I only handle conversion questions! Try asking something like 'convert 5 kilometers to miles' 🔄"
+    elif not any(keyword in prompt.lower() for keyword in ['convert', 'how many', 'what is']):
+        return "I only handle conversion questions! Try asking something like 'convert 5 kilometers to miles' 🔄"
+
+    # Everything this turn asks Gemini for has to fit in one latency budget
+    deadline = Deadline()
+
+    # Several conversions in one message are answered together
+    questions = split_queries(prompt)
+    if len(questions) > 1:
+        return answer_many(questions, temperature, model_name, deadline)
+
+    if temperature == 0:
+        # Answer simple conversions locally and only ask the model for the rest
+        local_answer = answer_query(query)
+        if local_answer:
+            metrics.incr("local_answers")
+            return local_answer
+
+    # Reuse an earlier model answer to the same normalized question
+    cache_key = make_cache_key(query, temperature, model_name) if query else None
+    if cache_key:
+        cached_response = lookup_cached(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+    if temperature == 0:
+        return ask_strict(prompt, query, model_name, cache_key, deadline)
+
+    # Creative answers come back as a generator of text chunks when streaming
+    if stream:
+        return stream_model(prompt, query, cache_key, deadline)
+    return ask_model(prompt, query, cache_key, deadline)
 
 # Add custom CSS
 st.markdown("""
@@ -199,31 +395,10 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Add these functions at the top after imports
-def save_chats_to_file():
-    """Save all chat histories to file"""
-    chat_data = {}
-    for chat_id, chat_info in st.session_state.chat_histories.items():
-        chat_data[chat_id] = {
-            "name": chat_info["name"],
-            "history": chat_info["history"]
-        }
-    
-    with open(CHAT_HISTORY_FILE, "w") as f:
-        json.dump(chat_data, f)
-
-def load_chats_from_file():
-    """Load all chat histories from file"""
-    try:
-        with open(CHAT_HISTORY_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
 # Modify the session state initialization
 if "chat_histories" not in st.session_state:
-    # Load existing chats from file when starting
-    st.session_state.chat_histories = load_chats_from_file()
+    # Load only chat names and counts; messages are read when a chat is opened
+    st.session_state.chat_histories = chat_store.list_chats()
     
 if "current_chat_id" not in st.session_state:
     # Set current chat to the first available chat, or None if no chats exist
@@ -231,6 +406,25 @@ if "current_chat_id" not in st.session_state:
     st.session_state.current_chat_id = chat_ids[0] if chat_ids else None
 if "new_chat_created" not in st.session_state:
     st.session_state.new_chat_created = False
+if "chat_sessions" not in st.session_state:
+    st.session_state.chat_sessions = {}
+if "chat_index" not in st.session_state:
+    st.session_state.chat_index = None
+if "chat_page" not in st.session_state:
+    st.session_state.chat_page = 0
+
+def get_chat_index():
+    """Return the sidebar's chat index, rebuilding it after chats changed"""
+    if st.session_state.chat_index is None:
+        st.session_state.chat_index = ChatIndex(st.session_state.chat_histories)
+    return st.session_state.chat_index
+
+def chats_changed():
+    """Mark the sidebar's chat index as out of date"""
+    st.session_state.chat_index = None
+
+def reset_chat_page():
+    st.session_state.chat_page = 0
 
 # Add sidebar for settings and chat history
 with st.sidebar:
@@ -241,6 +435,7 @@ with st.sidebar:
         index=1
     )
     temperature = st.slider("Temperature", 0.0, 1.0, 0.7)
+    stream_responses = st.toggle("Stream responses", value=True)
     
     st.markdown("""
     ### Temperature Guide:
@@ -248,23 +443,26 @@ with st.sidebar:
     - **1.0**: Responds to conversion questions with creative answers
     - Other questions will be ignored
     """)
+    cache_stats = response_cache.stats()
+    st.caption(f"Answer cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
     
     # New Chat Button
     if st.button("➕ New Chat"):
         new_chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-        st.session_state.chat_histories[new_chat_id] = {
-            "name": "New Chat",
-            "history": []
-        }
+        st.session_state.chat_histories[new_chat_id] = chat_store.create_chat(new_chat_id)
+        chats_changed()
         st.session_state.current_chat_id = new_chat_id
         st.session_state.new_chat_created = True
-        save_chats_to_file()  # Save after creating new chat
         st.rerun()
     
     st.markdown("### Chat History")
+    search = st.text_input("🔍 Search chats", key="chat_search", on_change=reset_chat_page)
     
-    # Display chat history
-    for chat_id, chat_data in st.session_state.chat_histories.items():
+    # Display one page of chats, most recent first; only these get widgets
+    page_ids, page_count = get_chat_index().page(search, st.session_state.chat_page, CHATS_PER_PAGE)
+    st.session_state.chat_page = min(st.session_state.chat_page, page_count - 1)
+    for chat_id in page_ids:
+        chat_data = st.session_state.chat_histories[chat_id]
         col1, col2 = st.columns([3, 1])
         with col1:
             if st.button(chat_data["name"], key=f"select_{chat_id}"):
@@ -273,14 +471,46 @@ with st.sidebar:
         with col2:
             if st.button("🗑️", key=f"delete_{chat_id}"):
                 del st.session_state.chat_histories[chat_id]
-                save_chats_to_file()  # Save after deletion
+                st.session_state.chat_sessions.pop(chat_id, None)
+                chats_changed()
+                chat_store.delete_chat(chat_id)  # Save after deletion
                 if st.session_state.current_chat_id == chat_id:
                     st.session_state.current_chat_id = None
                 st.rerun()
+    if not page_ids:
+        st.caption("No chats match your search.")
 
-# Update model configuration
-model = gen_ai.GenerativeModel(model_type)
-model.temperature = temperature
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀", key="chat_page_prev", disabled=st.session_state.chat_page == 0):
+                st.session_state.chat_page -= 1
+                st.rerun()
+        with col2:
+            st.caption(f"Page {st.session_state.chat_page + 1} of {page_count}")
+        with col3:
+            if st.button("▶", key="chat_page_next", disabled=st.session_state.chat_page >= page_count - 1):
+                st.session_state.chat_page += 1
+                st.rerun()
+
+    # Full-text search over every stored message, best matches first
+    message_search = st.text_input("🔎 Search all messages", key="message_search")
+    if message_search.strip():
+        with metrics.span("search"):
+            hits = chat_store.search_messages(search_expression(message_search))
+        for chat_id, seq, snippet in hits:
+            chat_name = st.session_state.chat_histories.get(chat_id, {}).get("name", "Chat")
+            # Plain text keeps markdown from earlier answers out of the button label
+            snippet = " ".join(snippet.replace("*", "").split())
+            if st.button(f"{chat_name}: {snippet}", key=f"hit_{chat_id}_{seq}"):
+                if chat_id not in st.session_state.chat_histories:
+                    # The chat was started in another session after this one loaded its list
+                    st.session_state.chat_histories = chat_store.list_chats()
+                    chats_changed()
+                st.session_state.current_chat_id = chat_id
+                st.rerun()
+        if not hits:
+            st.caption("No messages match your search.")
 
 # Function to translate roles between Gemini-Pro and Streamlit terminology
 def translate_role_for_streamlit(user_role):
@@ -289,88 +519,97 @@ def translate_role_for_streamlit(user_role):
     else:
         return user_role
 
-def save_chat_history(history, chat_id):
-    """Save chat history to both session state and file"""
+def save_chat_history(messages, chat_id):
+    """Save the messages added since the last save to the database"""
     if chat_id not in st.session_state.chat_histories:
-        st.session_state.chat_histories[chat_id] = {
-            "name": "New Chat",
-            "history": []
-        }
+        st.session_state.chat_histories[chat_id] = chat_store.create_chat(chat_id)
+    chats_changed()
     
-    chat_data = []
-    for message in history:
-        chat_data.append({
-            "role": message.role,
-            "text": message.parts[0].text
-        })
+    chat_info = st.session_state.chat_histories[chat_id]
+    new_messages = messages[chat_info["message_count"]:]
     
-    st.session_state.chat_histories[chat_id]["history"] = chat_data
-    # Save to file after updating session state
-    save_chats_to_file()
+    # Only the new turn is written, not the whole conversation
+    with metrics.span("persist"):
+        chat_store.append_messages(chat_id, new_messages)
+    chat_info["message_count"] += len(new_messages)
+    chat_info["updated_at"] = time.time()
 
 def load_chat_history(chat_id):
-    """Load chat history for a specific chat"""
+    """Load the stored messages of a specific chat from the database"""
     if chat_id in st.session_state.chat_histories:
-        chat_data = st.session_state.chat_histories[chat_id]["history"]
-        history = []
-        for message in chat_data:
-            if message["role"] == "user":
-                history.append({"role": "user", "parts": [message["text"]]})
-            else:
-                history.append({"role": "model", "parts": [message["text"]]})
-        return history
+        chat_data = chat_store.load_messages(chat_id)
+        st.session_state.chat_histories[chat_id]["message_count"] = len(chat_data)
+        return chat_data
     return []
 
-# Initialize or load chat session
-if "chat_session" not in st.session_state or st.session_state.current_chat_id is None:
-    # Only create a new chat if there are no chats at all
-    if not st.session_state.chat_histories and "chat_session" not in st.session_state:
-        new_chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-        st.session_state.chat_histories[new_chat_id] = {
-            "name": "New Chat",
-            "history": []
+# Only create a new chat if there are no chats at all
+if not st.session_state.chat_histories and not st.session_state.chat_sessions:
+    new_chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    st.session_state.chat_histories[new_chat_id] = chat_store.create_chat(new_chat_id)
+    chats_changed()
+    st.session_state.current_chat_id = new_chat_id
+
+# Keep one live chat per chat id; its messages are read from the database only once
+current_chat_id = st.session_state.current_chat_id
+if current_chat_id:
+    live_chat = st.session_state.chat_sessions.get(current_chat_id)
+    if live_chat is None:
+        summary, summary_upto = chat_store.load_summary(current_chat_id)
+        live_chat = {
+            "messages": load_chat_history(current_chat_id),
+            "summary": summary,
+            "summary_upto": summary_upto,
         }
-        st.session_state.current_chat_id = new_chat_id
-        save_chats_to_file()  # Save the new chat immediately
-    
-    # If we have a current_chat_id, load its history
-    if st.session_state.current_chat_id:
-        saved_history = load_chat_history(st.session_state.current_chat_id)
-        st.session_state.chat_session = model.start_chat(history=saved_history)
-else:
-    # This ensures chat session is reloaded when switching chats
-    current_chat_id = st.session_state.current_chat_id
-    saved_history = load_chat_history(current_chat_id)
-    st.session_state.chat_session = model.start_chat(history=saved_history)
+    if live_chat.get("settings") != (model_type, temperature):
+        # The session only carries context, which is rebuilt before every message;
+        # it is created by the first message that needs it
+        live_chat["session"] = None
+        live_chat["settings"] = (model_type, temperature)
+    st.session_state.chat_sessions[current_chat_id] = live_chat
+    st.session_state.chat_messages = live_chat["messages"]
 
 # Display the chatbot's title on the page
 st.title("֎ unitXchange - Bot")
 
 # Display the chat history
-for message in st.session_state.chat_session.history:
-    with st.chat_message(translate_role_for_streamlit(message.role)):
-        st.markdown(message.parts[0].text)
+with metrics.span("render_history"):
+    for message in st.session_state.get("chat_messages", []):
+        with st.chat_message(translate_role_for_streamlit(message["role"])):
+            st.markdown(message["text"])
 
 # Input field for user's message
 user_prompt = st.chat_input("Ask me anything...")
 if user_prompt:
-    # Add user's message to chat and display it
-    st.chat_message("user").markdown(user_prompt)
-
-    # Update chat title for new chats or if it's still "New Chat"
-    if (st.session_state.new_chat_created or 
-        st.session_state.chat_histories[st.session_state.current_chat_id]["name"] == "New Chat"):
-        chat_title = get_chat_title(user_prompt)
-        st.session_state.chat_histories[st.session_state.current_chat_id]["name"] = chat_title
-        st.session_state.new_chat_created = False
-        save_chats_to_file()  # Save the updated title immediately
-
-    # Generate appropriate response based on temperature and question type
-    response = generate_conversion_response(user_prompt, temperature)
-
-    # Display the response
-    with st.chat_message("assistant"):
-        st.markdown(response)
+    # Every span and counter below is also logged as one line for this turn
+    with metrics.turn("bot", model=model_type, temperature=temperature):
+        # Add user's message to chat and display it
+        st.chat_message("user").markdown(user_prompt)
+
+        # Update chat title for new chats or if it's still "New Chat"
+        if (st.session_state.new_chat_created or 
+            st.session_state.chat_histories[st.session_state.current_chat_id]["name"] == "New Chat"):
+            chat_title = get_chat_title(user_prompt)
+            st.session_state.chat_histories[st.session_state.current_chat_id]["name"] = chat_title
+            st.session_state.new_chat_created = False
+            chats_changed()
+            chat_store.rename_chat(st.session_state.current_chat_id, chat_title)  # Save the updated title immediately
+
+        # Generate appropriate response based on temperature and question type
+        response = generate_conversion_response(
+            user_prompt, temperature, model_type, stream=stream_responses
+        )
+
+        # Display the response, rendering streamed chunks as they arrive
+        # (a streamed answer's llm_call span runs inside this render span)
+        with st.chat_message("assistant"), metrics.span("render"):
+            if isinstance(response, str):
+                st.markdown(response)
+            else:
+                response = st.write_stream(response)
         
-    # Save updated chat history
-    save_chat_history(st.session_state.chat_session.history, st.session_state.current_chat_id)
\ No newline at end of file
+        # Save updated chat history
+        st.session_state.chat_messages.extend([
+            {"role": "user", "text": user_prompt},
+            {"role": "model", "text": response},
+        ])
+        save_chat_history(st.session_state.chat_messages, st.session_state.current_chat_id)
\ No newline at end of file